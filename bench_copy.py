@@ -0,0 +1,50 @@
+"""
+Benchmark of Stager.copy_sharded: prints rows/s for each number of
+connections, copying the same files into a staging table.
+
+Usage: python bench_copy.py [--data log|song] [--shards 1 2 4 8] [--dsn DSN]
+"""
+import argparse
+import time
+import db
+import etl
+from staging import extract
+
+
+def bench(stager, connect, shards, files):
+    conn = connect()
+    cur = conn.cursor()
+    stager.create_table(cur)
+    conn.commit()
+    try:
+        start = time.perf_counter()
+        stager.copy_sharded(connect, shards, files=files)
+        elapsed = time.perf_counter() - start
+        cur.execute('SELECT COUNT(*) FROM {};'.format(stager.get_table_name()))
+        rows = cur.fetchone()[0]
+    finally:
+        stager.drop_table(cur)
+        conn.commit()
+        conn.close()
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', choices=['log', 'song'], default='log')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--dsn', default=db.DSN)
+    args = parser.parse_args()
+
+    stager = etl.log_stager if args.data == 'log' else etl.song_stager
+    files = list(extract(stager.filepath))
+    connect = lambda: db.connect(args.dsn)
+
+    print('{:>6} {:>10} {:>10} {:>12}'.format('shards', 'rows', 'seconds', 'rows/s'))
+    for n in args.shards:
+        rows, elapsed = bench(stager, connect, n, files)
+        print('{:>6} {:>10} {:>10.3f} {:>12.0f}'.format(n, rows, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
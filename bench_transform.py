@@ -0,0 +1,56 @@
+"""
+Benchmark of the log transformers: prints rows/s and MB/s of the
+row-wise transform_log and the columnar transform_log_batch, for each
+batch size, over the same log files (e.g. from generate_data.py).
+
+Usage: python bench_transform.py [LOG_DIR] [--batch-sizes 0 1000 10000] [--repeat N]
+"""
+import argparse
+import time
+import etl
+import sources
+from staging import extract
+
+
+def bench(transformer, files, repeat):
+    """
+    Returns the number of rows transformer yields for files, and
+    the best time of repeat runs over all of them.
+    """
+    best = None
+    for _ in range(repeat):
+        rows = 0
+        start = time.perf_counter()
+        for f in files:
+            for text in transformer(f):
+                rows += text.count('\n')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log_dir', nargs='?', default=etl.log_stager.filepath)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[0, 1000, 10000],
+                        help='records per batch of transform_log_batch (0: whole file)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    files = list(extract(args.log_dir))
+    size = sum(sources.size(f) for f in files)
+    transformers = [('transform_log', etl.transform_log)]
+    for n in args.batch_sizes:
+        transformers.append(('transform_log_batch({})'.format(n or 'file'),
+                             lambda f, n=n: etl.transform_log_batch(f, batch_size=n or None)))
+
+    print('{:<28} {:>10} {:>10} {:>12} {:>10}'.format(
+        'transformer', 'rows', 'seconds', 'rows/s', 'MB/s'))
+    for name, transformer in transformers:
+        rows, elapsed = bench(transformer, files, args.repeat)
+        print('{:<28} {:>10} {:>10.3f} {:>12.0f} {:>10.1f}'.format(
+            name, rows, elapsed, rows / elapsed, size / (1 << 20) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
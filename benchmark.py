@@ -0,0 +1,138 @@
+"""
+Benchmark of the ETL pipeline on a dataset (e.g. from generate_data.py).
+
+Reports files/s, rows/s, MB/s and peak RSS for each stage: extract,
+transform, COPY and, if a dsn is given, star schema insert.
+The dsn should point to a scratch database: the star schema tables
+are created there if needed and truncated.
+
+Without a dsn, COPY streams go to a sink from sinks.py: a null sink
+that only counts them, or a file sink (--sink-dir) for later replay.
+
+With --pipeline-depth, the transform feeds COPY from its own thread,
+and the queue statistics are printed after each COPY.
+
+Usage: python benchmark.py ROOT [--workers N] [--binary] [--no-stream]
+                                [--pipeline-depth N] [--dsn DSN | --sink-dir DIR]
+"""
+import argparse
+import os
+import resource
+import time
+import psycopg2
+import create_tables
+import etl
+import sources
+import sql_queries
+from sinks import NullSink, FileSink
+from staging import Stager, extract
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process and of its
+    finished child processes, in MB.
+    """
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_kb, children_kb) / 1024
+
+
+def make_stagers(root):
+    """
+    Returns the song and log stagers of etl.py, reading from root.
+    """
+    return [Stager(os.path.join(root, sub), s.table_name, s.columns,
+                   s.transformer, s.row_transformer)
+            for sub, s in [('song_data', etl.song_stager), ('log_data', etl.log_stager)]]
+
+
+def report(stage, seconds, files=None, rows=None, nbytes=None):
+    def rate(n, scale=1):
+        return '{:>12.1f}'.format(n / scale / seconds) if n is not None and seconds else '{:>12}'.format('-')
+    print('{:<24} {:>9.3f} {} {} {} {:>10.1f}'.format(
+        stage, seconds, rate(files), rate(rows), rate(nbytes, 1 << 20), peak_rss_mb()))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='directory with song_data and log_data')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--binary', action='store_true')
+    parser.add_argument('--no-stream', dest='stream', action='store_false')
+    parser.add_argument('--pipeline-depth', type=int, default=None)
+    parser.add_argument('--dsn', default=None)
+    parser.add_argument('--sink-dir', default=None)
+    args = parser.parse_args()
+
+    stagers = make_stagers(args.root)
+    print('{:<24} {:>9} {:>12} {:>12} {:>12} {:>10}'.format(
+        'stage', 'seconds', 'files/s', 'rows/s', 'MB/s', 'peak MB'))
+
+    conn = cur = None
+    if args.dsn:
+        conn = psycopg2.connect(args.dsn)
+        cur = conn.cursor()
+        create_tables.create_tables(cur, conn)
+        cur.execute('TRUNCATE songplays, users, songs, artists, time;')
+        conn.commit()
+
+    try:
+        for s in stagers:
+            name = s.get_table_name()
+            files, seconds = timed(lambda: list(extract(s.filepath)))
+            size = sum(sources.size(f) for f in files)
+            report('extract ' + name, seconds, len(files), nbytes=size)
+
+            def transform():
+                rows = 0
+                for text in s.transform(args.workers, files=files, binary=args.binary):
+                    rows += 1 if args.binary else text.count('\n')
+                return rows
+            rows, seconds = timed(transform)
+            if args.binary and args.workers:
+                rows = None  # binary chunks from workers hold many rows
+            report('transform ' + name, seconds, len(files), rows, size)
+
+            if cur is not None:
+                s.create_table(cur)
+                conn.commit()
+                _, seconds = timed(lambda: s.copy(cur, args.stream, args.workers, files=files,
+                                                  binary=args.binary,
+                                                  pipeline_depth=args.pipeline_depth))
+                conn.commit()
+                cur.execute('SELECT COUNT(*) FROM {};'.format(name))
+                report('copy ' + name, seconds, len(files), cur.fetchone()[0], size)
+            else:
+                sink = FileSink(args.sink_dir) if args.sink_dir else NullSink()
+                _, seconds = timed(lambda: s.copy(sink, args.stream, args.workers, files=files,
+                                                  binary=args.binary,
+                                                  pipeline_depth=args.pipeline_depth))
+                rows = None if args.binary or args.sink_dir else sink.rows
+                report('copy ' + name + ' (sink)', seconds, len(files), rows, size)
+            if args.pipeline_depth:
+                print('  pipeline:', ', '.join('{}={:.3g}'.format(k, v)
+                                               for k, v in s.pipeline_stats.items()))
+
+        if cur is not None:
+            for query in sql_queries.insert_queries:
+                table = query.split()[2]
+                _, seconds = timed(lambda: cur.execute(query))
+                conn.commit()
+                report('insert ' + table, seconds, rows=cur.rowcount)
+    finally:
+        if cur is not None:
+            for s in stagers:
+                cur.execute('DROP TABLE IF EXISTS {};'.format(s.get_table_name()))
+            conn.commit()
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,21 @@
+import datetime
+import re
+from collections import defaultdict
 import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+import db
+import scheduler
+from sql_queries import (create_table_queries, drop_table_queries, fk_queries,
+                         idx_queries, schema_columns_select, schema_keys_select,
+                         schema_kinds_select, partitioned_create_queries,
+                         partition_create, partition_attach, partition_detach,
+                         partitions_select, staged_months_select,
+                         dependent_views_select)
+
+
+# names of the star schema tables, in the order of create_table_queries
+table_names = [re.search(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', q,
+                         re.IGNORECASE).group(1)
+               for q in create_table_queries]
 
 
 def create_database():
@@ -7,13 +23,12 @@ def create_database():
     - Creates and connects to the sparkifydb
     - Returns the connection and cursor to sparkifydb
 
-    Note: dbname is set to brendan, since student doesn't have the required permissions.
+    Note: the database is created from db.ADMIN_DSN (dbname=brendan),
+    since student doesn't have the required permissions.
     """
     
     # connect to default database
-    # dsn = "host=127.0.0.1 dbname=studentdb user=student password=student"
-    # conn = psycopg2.connect(dsn)
-    conn = psycopg2.connect("dbname=brendan")
+    conn = psycopg2.connect(db.ADMIN_DSN)
     conn.set_session(autocommit=True)
     cur = conn.cursor()
     
@@ -26,7 +41,7 @@ def create_database():
     conn.close()    
     
     # connect to sparkify database
-    conn = psycopg2.connect("dbname=sparkifydb user=student password=student")
+    conn = db.connect()
     cur = conn.cursor()
     
     return cur, conn
@@ -41,16 +56,262 @@ def drop_tables(cur, conn):
         conn.commit()
 
 
-def create_tables(cur, conn):
+def table_queries(partitioned=()):
+    """
+    Returns `create_table_queries`, with the tables named in partitioned
+    (songplays and/or time) created as partitioned by month instead.
+    """
+    unknown = set(partitioned) - partitioned_create_queries.keys()
+    if unknown:
+        raise ValueError('tables cannot be partitioned: {}'.format(sorted(unknown)))
+    return [partitioned_create_queries[table] if table in partitioned else query
+            for table, query in zip(table_names, create_table_queries)]
+
+
+def create_tables(cur, conn, partitioned=()):
     """
     Creates each table using the queries in `create_table_queries` list. 
+
+    Tables named in partitioned are partitioned by month (see `table_queries`).
     """
-    for query in create_table_queries:
+    for query in table_queries(partitioned):
         cur.execute(query)
         conn.commit()
 
 
-def main():
+def table_definitions(cur, schema='public'):
+    """
+    Returns a dict of table name: (columns, keys, kind) for the star
+    schema tables that exist in schema, where columns lists the name,
+    type, nullability and whether it has a default of each column, keys
+    lists the primary key and unique columns, and kind holds the table's
+    relkind ('r' for a table, 'p' for a partitioned table).
+    """
+    definitions = defaultdict(lambda: ([], [], []))
+    cur.execute(schema_columns_select, (schema, table_names))
+    for table, *column in cur.fetchall():
+        definitions[table][0].append(tuple(column))
+    cur.execute(schema_keys_select, (schema, table_names))
+    for table, *key in cur.fetchall():
+        definitions[table][1].append(tuple(key))
+    cur.execute(schema_kinds_select, (schema, table_names))
+    for table, kind in cur.fetchall():
+        definitions[table][2].append(kind)
+    return dict(definitions)
+
+
+def expected_definitions(cur, conn, partitioned=()):
+    """
+    Returns the table definitions (see `table_definitions`) that
+    `table_queries` creates, by running them in a scratch schema
+    in a transaction that is rolled back.
+    """
+    try:
+        cur.execute("CREATE SCHEMA schema_check;")
+        cur.execute("SET LOCAL search_path TO schema_check;")
+        for query in table_queries(partitioned):
+            cur.execute(query)
+        return table_definitions(cur, 'schema_check')
+    finally:
+        conn.rollback()
+
+
+def schema_diff(expected, actual):
+    """
+    Compares table definitions, returning the lists of tables that
+    match, that differ, and that are missing from actual.
+    """
+    matching, differing, missing = [], [], []
+    for table in table_names:
+        if table not in actual:
+            missing.append(table)
+        elif actual[table] != expected[table]:
+            differing.append(table)
+        else:
+            matching.append(table)
+    return matching, differing, missing
+
+
+def drop_post_load(cur):
+    """
+    Drops the foreign keys and indices in `fk_queries` and `idx_queries`,
+    so a reused schema is loaded without them, like a new one.
+    """
+    for query in fk_queries:
+        table, name = re.search(r'ALTER\s+TABLE\s+(\w+)\s+ADD\s+CONSTRAINT\s+(\w+)',
+                                query, re.IGNORECASE).groups()
+        cur.execute('ALTER TABLE IF EXISTS {} DROP CONSTRAINT IF EXISTS {};'.format(table, name))
+    for name in scheduler.index_names(idx_queries):
+        cur.execute('DROP INDEX IF EXISTS {};'.format(name))
+
+
+def reset_tables(cur, conn, partitioned=()):
+    """
+    Empties the star schema tables of an existing database for a new load.
+
+    - Tables matching `table_queries(partitioned)` are truncated.
+
+    - Tables that differ are dropped and created again, and missing
+    tables are created.
+
+    - The foreign keys and indices set after a load are dropped.
+
+    Returns the lists of truncated, recreated and created tables.
+    """
+    expected = expected_definitions(cur, conn, partitioned)
+    matching, differing, missing = schema_diff(expected, table_definitions(cur))
+    drop_post_load(cur)
+    for table in differing:
+        cur.execute('DROP TABLE {} CASCADE;'.format(table))
+    if matching:
+        cur.execute('TRUNCATE {} RESTART IDENTITY;'.format(', '.join(matching)))
+    for query in table_queries(partitioned):
+        cur.execute(query)
+    conn.commit()
+    return matching, differing, missing
+
+
+# schemas of the tables built by a shadow load, and of the tables it replaced
+shadow_schema = 'shadow'
+retired_schema = 'retired'
+
+
+def create_shadow(schema=shadow_schema, partitioned=()):
+    """
+    Creates the star schema tables in an empty schema, for a load that
+    doesn't touch the tables readers use (see `swap_shadow`).
+    The database is created first if it doesn't exist.
+
+    Tables named in partitioned are partitioned by month (see `table_queries`).
+    """
+    try:
+        conn = db.connect()
+    except psycopg2.OperationalError:
+        cur, conn = create_database()
+        create_tables(cur, conn)
+    cur = conn.cursor()
+    cur.execute('DROP SCHEMA IF EXISTS {} CASCADE;'.format(schema))
+    cur.execute('CREATE SCHEMA {};'.format(schema))
+    cur.execute('SET search_path TO {};'.format(schema))
+    for query in table_queries(partitioned):
+        cur.execute(query)
+    conn.commit()
+    conn.close()
+
+
+def swap_shadow(cur, conn, schema=shadow_schema):
+    """
+    Replaces the star schema tables in public with those in schema, in
+    one transaction: readers see either the old tables or the new ones,
+    with their indices and constraints. The old tables are then dropped.
+
+    The transaction locks every public table first, so it waits for
+    running queries and then holds up new ones only for the renames.
+    Partitions are moved along with their tables.
+
+    Views on the old tables would follow them and be dropped with them,
+    so they are redefined on the new tables in the same transaction
+    (keeping their privileges). Other objects that depend on the old
+    tables, such as materialized views, cannot be redefined that way:
+    the swap raises ValueError, leaving the public tables as they are.
+    """
+    cur.execute('SET LOCAL search_path TO public;')
+    cur.execute('DROP SCHEMA IF EXISTS {} CASCADE;'.format(retired_schema))
+    cur.execute('CREATE SCHEMA {};'.format(retired_schema))
+    cur.execute("SELECT table_name FROM information_schema.tables "
+                "WHERE table_schema = 'public' AND table_name = ANY(%s);", (table_names,))
+    existing = {row[0] for row in cur.fetchall()}
+    live = [t for t in table_names if t in existing]
+    if live:
+        cur.execute('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE;'.format(
+            ', '.join('public.' + t for t in live)))
+    cur.execute(dependent_views_select, (['public.' + t for t in live],))
+    views = cur.fetchall()
+    others = [name for name, kind, _ in views if kind != 'v']
+    if others:
+        conn.rollback()
+        raise ValueError('cannot swap tables with dependent objects other than views: '
+                         '{}'.format(', '.join(others)))
+    for table in table_names:
+        if table in live:
+            for name in [table, *partitions(cur, 'public.' + table)]:
+                cur.execute('ALTER TABLE public.{} SET SCHEMA {};'.format(name, retired_schema))
+        for name in [table, *partitions(cur, schema + '.' + table)]:
+            cur.execute('ALTER TABLE {}.{} SET SCHEMA public;'.format(schema, name))
+    for name, _, definition in views:
+        cur.execute('CREATE OR REPLACE VIEW {} AS {}'.format(name, definition))
+    conn.commit()
+    cur.execute('DROP SCHEMA {} CASCADE;'.format(retired_schema))
+    conn.commit()
+
+
+def month_bounds(month):
+    """
+    Returns the first days of month (a date) and of the next month.
+    """
+    start = month.replace(day=1)
+    end = (start + datetime.timedelta(days=31)).replace(day=1)
+    return start, end
+
+
+def partition_name(table, month):
+    """
+    Returns the name of the partition of table for month, e.g. songplays_2018_11.
+    """
+    return '{}_{:%Y_%m}'.format(table, month)
+
+
+def partitions(cur, table):
+    """
+    Returns the names of the partitions of table (which may be schema
+    qualified), or an empty list if it has none or doesn't exist.
+    """
+    cur.execute(partitions_select, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def staged_months(cur):
+    """
+    Returns the months (as dates of their first day) of the events in log_staging.
+    """
+    cur.execute(staged_months_select)
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_partitions(cur, table, months):
+    """
+    Creates the partitions of table for months that don't exist yet.
+    Returns a list of (name, start, end) of the partitions of months.
+    """
+    created = []
+    for month in months:
+        name = partition_name(table, month)
+        start, end = month_bounds(month)
+        cur.execute(partition_create.format(name, table), (start, end))
+        created.append((name, start, end))
+    return created
+
+
+def detach_partition(cur, table, month):
+    """
+    Detaches the partition of table for month, which is kept as a table
+    of its own: queries on table no longer scan it, and it can be
+    archived or dropped without rewriting table.
+    Detach the songplays partition of a month before the time partition.
+    """
+    cur.execute(partition_detach.format(table, partition_name(table, month)))
+
+
+def attach_partition(cur, table, month):
+    """
+    Attaches the table named like the partition of table for month
+    (e.g. one detached earlier, or loaded on its own) as that partition.
+    """
+    cur.execute(partition_attach.format(table, partition_name(table, month)),
+                month_bounds(month))
+
+
+def main(reuse=False, partitioned=()):
     """
     - Drops (if exists) and Creates the sparkify database. 
     
@@ -62,11 +323,31 @@ def main():
     - Creates all tables needed. 
     
     - Finally, closes the connection. 
+
+    If reuse=True and the database exists, it is kept instead, and its
+    tables are emptied or recreated as needed (see `reset_tables`),
+    which saves creating the database and starting with a cold cache.
+
+    Tables named in partitioned (songplays and/or time) are partitioned
+    by month (see `table_queries`).
     """
+    if reuse:
+        try:
+            conn = db.connect()
+        except psycopg2.OperationalError:
+            pass  # no database yet
+        else:
+            cur = conn.cursor()
+            truncated, recreated, created = reset_tables(cur, conn, partitioned)
+            print('* Reusing schema: truncated {}, recreated {}, created {}'.format(
+                truncated, recreated, created))
+            conn.close()
+            return
+
     cur, conn = create_database()
     
     drop_tables(cur, conn)
-    create_tables(cur, conn)
+    create_tables(cur, conn, partitioned)
 
     conn.close()
 
@@ -0,0 +1,102 @@
+import uuid
+import psycopg2
+
+
+# connection string for the sparkify database
+DSN = "host=127.0.0.1 dbname=sparkifydb user=student password=student"
+
+# connection string for the database from which sparkifydb is created
+# (student doesn't have the permissions to create databases)
+ADMIN_DSN = "dbname=brendan"
+
+
+def connect(dsn=DSN, search_path=None):
+    """
+    Returns a new connection to the sparkify database.
+
+    If search_path is given (e.g. 'shadow, public'), unqualified table
+    names are looked up in those schemas, in order, instead of public.
+    """
+    if search_path:
+        return psycopg2.connect(dsn, options='-c search_path={}'.format(
+            search_path.replace(' ', '')))
+    return psycopg2.connect(dsn)
+
+
+class ConnectionGroup:
+    """
+    A group of connections whose transactions are committed together.
+
+    Used as a context manager: the connections are opened on entry;
+    on exit, they are all committed if no exception was raised and all
+    rolled back otherwise, and then closed.
+
+    With two_phase=True, each connection runs a prepared transaction,
+    and the group is only committed once every connection has prepared,
+    so either all transactions commit or none do. This requires the
+    server setting max_prepared_transactions > 0.
+    Otherwise, the connections are committed one after the other.
+
+    Attributes
+    ----------
+
+    connect: function, returns a new connection
+
+    size: int, number of connections
+
+    two_phase: bool, whether to use two-phase commit
+
+    """
+    def __init__(self, connect, size, two_phase=False):
+        self.connect = connect
+        self.size = size
+        self.two_phase = two_phase
+        self.conns = []
+
+    def __enter__(self):
+        gtrid = uuid.uuid4().hex
+        try:
+            for i in range(self.size):
+                conn = self.connect()
+                self.conns.append(conn)
+                if self.two_phase:
+                    conn.tpc_begin(conn.xid(0, gtrid, str(i)))
+        except Exception:
+            self.close()
+            raise
+        return self.conns
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+
+    def commit(self):
+        if self.two_phase:
+            try:
+                for conn in self.conns:
+                    conn.tpc_prepare()
+            except Exception:
+                self.rollback()
+                raise
+            for conn in self.conns:
+                conn.tpc_commit()
+        else:
+            for conn in self.conns:
+                conn.commit()
+
+    def rollback(self):
+        for conn in self.conns:
+            if self.two_phase:
+                conn.tpc_rollback()
+            else:
+                conn.rollback()
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
@@ -0,0 +1,102 @@
+import threading
+import sql_queries
+from string_iterator import StringIteratorIO
+
+
+# columns of the dimension staging tables (see sql_queries.create_time_staging
+# and create_user_staging)
+time_cols = ['start_time', 'hour', 'day', 'week', 'month', 'year', 'weekday']
+user_cols = ['user_id', 'first_name', 'last_name', 'gender', 'level']
+
+# columns of the log rows read for each dimension, in the order above
+time_fields = ['ts', 'hour', 'day', 'week', 'month', 'year', 'weekday']
+user_fields = ['userId', 'firstName', 'lastName', 'gender', 'level']
+
+# columns of the log rows that only the dimensions use
+dimension_only_fields = ['firstName', 'lastName', 'gender',
+                         'hour', 'day', 'week', 'month', 'year', 'weekday']
+
+
+class DimensionCollector:
+    """
+    Collects the distinct time rows and the latest row of each user
+    from the log rows as they are copied, and strips the columns only
+    these dimensions use from the rows, so the log staging table holds
+    just what songplays needs.
+
+    The collected rows are copied to their own small staging tables,
+    time_staging and user_staging, which the time and users inserts
+    read without deduplicating every event again.
+
+    Attributes
+    ----------
+
+    columns: list, names of the columns of the log rows, which must
+    include those in time_fields and user_fields
+
+    lean_columns: list, names of the columns of the rows returned by tap
+
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.lean_columns = [c for c in self.columns if c not in dimension_only_fields]
+        self._keep = [self.columns.index(c) for c in self.lean_columns]
+        self._time = [self.columns.index(c) for c in time_fields]
+        self._user = [self.columns.index(c) for c in user_fields]
+        self._ts = self.columns.index('ts')
+        self.times = {}  # start_time: row
+        self.users = {}  # user_id: (ts, row)
+        self._lock = threading.Lock()
+
+    def tap(self, chunk):
+        """
+        Collects the time and user rows of a chunk of tab separated log
+        rows, and returns the chunk with the columns in lean_columns
+        (for Stager.copy's tap argument).
+        """
+        times = {}
+        users = {}
+        lean = []
+        # rows end with '\n' (other line breaks may be data), so the last
+        # piece is empty
+        lines = chunk.split('\n')
+        if not lines[-1]:
+            lines.pop()
+        for line in lines:
+            fields = line.split('\t')
+            ts = fields[self._ts]
+            times[ts] = '\t'.join([fields[i] for i in self._time])
+            user_id = fields[self._user[0]]
+            # timestamps are formatted as %Y-%m-%d %H:%M:%S, so they sort as strings
+            if user_id not in users or ts >= users[user_id][0]:
+                users[user_id] = (ts, '\t'.join([fields[i] for i in self._user]))
+            lean.append('\t'.join([fields[i] for i in self._keep]))
+        with self._lock:
+            for ts, row in times.items():
+                self.times.setdefault(ts, row)
+            for user_id, (ts, row) in users.items():
+                if user_id not in self.users or ts >= self.users[user_id][0]:
+                    self.users[user_id] = (ts, row)
+        return '\n'.join(lean) + '\n' if lean else ''
+
+    def create_tables(self, cur):
+        """
+        Creates time_staging and user_staging, dropping them first if they exist.
+        """
+        cur.execute(sql_queries.create_time_staging)
+        cur.execute(sql_queries.create_user_staging)
+
+    def drop_tables(self, cur):
+        cur.execute(sql_queries.drop_dimension_staging)
+
+    def copy(self, cur):
+        """
+        Copies the collected rows to time_staging and user_staging.
+        Returns the number of rows copied.
+        """
+        for table, columns, rows in [
+                ('time_staging', time_cols, self.times.values()),
+                ('user_staging', user_cols, (row for _, row in self.users.values()))]:
+            with StringIteratorIO(row + '\n' for row in rows) as f:
+                cur.copy_from(f, table, columns=tuple(columns), null='')
+        return len(self.times) + len(self.users)
@@ -1,17 +1,28 @@
 from cProfile import Profile
 import csv
 import datetime
+import functools
 import io
 import json
 import os
 import glob
+import sys
 import time
+from itertools import islice
+import numpy as np
 import pandas as pd
 from pstats import Stats
 import psycopg2
 import create_tables
+import db
+import scheduler
 import sql_queries
-from staging import Stager
+from manifest import Manifest
+from dimensions import DimensionCollector
+from metrics import Metrics, query_name
+from song_index import SongIndex
+from sources import open_file, iter_records
+from staging import Stager, FileInfo
 
 
 # defining columns and transformer for `song_stager`
@@ -27,12 +38,24 @@ def transform_song(filepath):
     Load a .json object from filepath and return it as
     a tab separated string ending with a newline.
     """
-    f = json.load(open(filepath))
+    with open_file(filepath) as fp:
+        f = json.load(fp)
     return '\t'.join([str(v) if (v := f[k]) else ''
                       for k in song_cols.keys()]) + '\n'
 
 
-song_stager = Stager('data/song_data', 'song_staging', song_cols, transform_song)
+def song_rows(filepath):
+    """
+    Load a .json object from filepath and yield it as a tuple
+    of values, with None for empty values (for binary COPY).
+    """
+    with open_file(filepath) as fp:
+        f = json.load(fp)
+    yield tuple(v if (v := f[k]) else None for k in song_cols.keys())
+
+
+song_stager = Stager('data/song_data', 'song_staging', song_cols,
+                     transform_song, song_rows)
 
 
 # defining columns and transformer for `log_stager`
@@ -46,46 +69,278 @@ log_cols = {'song': 'TEXT', 'artist': 'TEXT',
             'month': 'INT', 'year': 'INT',
             'weekday': 'BOOLEAN'}
 
+# fields of the log .json objects copied as they are
+log_json_cols = ['song', 'artist', 'userId', 'firstName', 'lastName',
+                 'gender', 'level', 'sessionId', 'location', 'userAgent']
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def time_columns(t):
+    """
+    Returns the time-dimension values of the UNIX timestamp t (in seconds):
+    (datetime, hour, day, week, month, year, weekday).
+
+    Memoized, since the events of a log share few distinct seconds;
+    hits and misses are reported by time_columns.cache_info().
+    """
+    x = datetime.datetime.fromtimestamp(t)
+    return (x, x.hour, x.day, x.isocalendar()[1],
+            x.month, x.year, x.weekday() not in [5, 6])
 
-def transform_log(filepath):
+
+@functools.lru_cache(maxsize=1 << 16)
+def time_text(t):
+    """
+    Returns the time-dimension values of the UNIX timestamp t as
+    a tab separated string. Memoized like `time_columns`.
+    """
+    x, *values = time_columns(t)
+    return '\t'.join([x.strftime("%Y-%m-%d %H:%M:%S"), *map(str, values)])
+
+
+def transform_log(filepath, index=None):
     """
     Load .json objects (separated by newlines) from filepath, transform
-    them, and return them as tab separated strings on separate lines.
+    them, and yield them as tab separated strings, one row at a time.
+
+    If index (a SongIndex) is given, the song_id and artist_id of the
+    song are added to each row (empty if the song is not found).
     """
-    cols = ['song', 'artist', 'userId', 'firstName', 'lastName',
-            'gender', 'level', 'sessionId', 'location', 'userAgent']
+    cols = log_json_cols
+
+    for line in iter_records(filepath):
+        jf = json.loads(line)
+        if jf['userId'] and (jf['page'] == 'NextSong'):
+            jf['userAgent'] = jf['userAgent'].strip('"')
+            
+            temp1 = '\t'.join([str(v) if (v := jf[k]) else '' for k in cols])
+
+            t = round(jf['ts']/1000)  # UNIX timestamp, ignore ms
+            temp2 = time_text(t)
+
+            if index is not None:
+                ids = index.get(jf['song'] or '', jf['artist'] or '') or ('', '')
+                yield temp1 + '\t' + temp2 + '\t' + '\t'.join(ids) + '\n'
+            else:
+                yield temp1 + '\t' + temp2 + '\n'
 
-    result = ''
-    with open(filepath, 'rt') as f:
-        for line in f:
-            jf = json.loads(line)
-            if jf['userId'] and (jf['page'] == 'NextSong'):
-                jf['userAgent'] = jf['userAgent'].strip('"')
-                
-                temp1 = '\t'.join([str(v) if (v := jf[k]) else '' for k in cols])
 
-                t = round(jf['ts']/1000)  # UNIX timestamp, ignore ms
-                x = datetime.datetime.fromtimestamp(t)
-                
-                temp2 = '\t'.join([x.strftime("%Y-%m-%d %H:%M:%S"),
-                                   str(x.hour),
-                                   str(x.day),
-                                   str(x.isocalendar()[1]),
-                                   str(x.month),
-                                   str(x.year),
-                                   str(x.weekday() not in [5, 6])])
+def log_rows(filepath, index=None):
+    """
+    Load .json objects (separated by newlines) from filepath, transform
+    them, and yield them as tuples of values (for binary COPY).
+
+    If index (a SongIndex) is given, the song_id and artist_id of the
+    song are added to each row (None if the song is not found).
+    """
+    for line in iter_records(filepath):
+        jf = json.loads(line)
+        if jf['userId'] and (jf['page'] == 'NextSong'):
+            jf['userAgent'] = jf['userAgent'].strip('"')
+
+            row = [v if (v := jf[k]) else None for k in log_json_cols]
+            row[2] = int(row[2])  # userId
 
-                result += temp1 + '\t' + temp2 + '\n'
-    return result
+            t = round(jf['ts']/1000)  # UNIX timestamp, ignore ms
+            if index is not None:
+                ids = index.get(jf['song'] or '', jf['artist'] or '') or (None, None)
+                yield (*row, *time_columns(t), *ids)
+            else:
+                yield (*row, *time_columns(t))
 
 
-log_stager = Stager('data/log_data', 'log_staging', log_cols, transform_log)
+def local_seconds(t):
+    """
+    Returns the array of UNIX timestamps t (in seconds) shifted by the
+    local UTC offset at each, so they read as local time, like
+    datetime.fromtimestamp.
+
+    The offset is looked up once per distinct quarter hour, since time
+    zones change their offsets at quarter hour boundaries.
+    """
+    quarters, inverse = np.unique(t // 900, return_inverse=True)
+    offsets = np.array([time.localtime(q * 900).tm_gmtoff for q in quarters.tolist()])
+    return t + offsets[inverse]
+
+
+def _text_column(values):
+    """
+    Returns a Series of values as strings, with '' for empty values
+    (None, missing, '' or 0), like `transform_log`'s str(v) if v else ''.
+    """
+    empty = values.isna() | ~values.fillna('').astype(bool)
+    return values.astype(str).where(~empty, '')
+
+
+def transform_log_batch(filepath, index=None, batch_size=None):
+    """
+    Columnar version of `transform_log`: transforms the events of
+    filepath in batches of batch_size records (or all of them at once),
+    and yields each batch as one block of tab separated rows.
+
+    The records of a batch are parsed with a single json.loads call into
+    a DataFrame, which is filtered and formatted with array operations;
+    the time columns are derived from the timestamps in local time, like
+    `time_columns` (see `local_seconds`).
+
+    If index (a SongIndex) is given, the song_id and artist_id of the
+    song are added to each row (empty if the song is not found).
+    """
+    records = iter_records(filepath)
+    while (batch := list(islice(records, batch_size))):
+        events = pd.DataFrame(json.loads(b'[' + b','.join(batch) + b']'),
+                              columns=[*log_json_cols, 'page', 'ts'], dtype=object)
+        events = events[(events['page'] == 'NextSong')
+                        & events['userId'].fillna('').astype(bool)]
+        if events.empty:
+            continue
+        events['userAgent'] = events['userAgent'].str.strip('"')
+
+        # UNIX timestamp, ignore ms (rounded half to even, like round())
+        t = np.round(events['ts'].to_numpy(dtype='int64') / 1000).astype('int64')
+        x = pd.Series(pd.to_datetime(local_seconds(t), unit='s'), index=events.index)
+        columns = [_text_column(events[k]) for k in log_json_cols]
+        columns += [x.dt.strftime('%Y-%m-%d %H:%M:%S'), x.dt.hour.astype(str),
+                    x.dt.day.astype(str), x.dt.isocalendar().week.astype(str),
+                    x.dt.month.astype(str), x.dt.year.astype(str),
+                    (x.dt.weekday < 5).astype(str)]
+        if index is not None:
+            ids = [index.get(song or '', artist or '') or ('', '') for song, artist
+                   in zip(events['song'].fillna(''), events['artist'].fillna(''))]
+            columns += [pd.Series([i[0] for i in ids], index=events.index),
+                        pd.Series([i[1] for i in ids], index=events.index)]
+        lines = columns[0].str.cat(columns[1:], sep='\t')
+        yield '\n'.join(lines) + '\n'
+
+
+log_stager = Stager('data/log_data', 'log_staging', log_cols,
+                    transform_log, log_rows)
+
+
+# columns of `log_staging` when songs are resolved during the transform
+log_cols_resolved = {**log_cols, 'song_id': 'TEXT', 'artist_id': 'TEXT'}
+
+
+def resolved_log_stager(index):
+    """
+    Returns a Stager like `log_stager`, whose transformers resolve
+    the song_id and artist_id of each event with index (a SongIndex).
+    """
+    return Stager(log_stager.filepath, log_stager.table_name, log_cols_resolved,
+                  functools.partial(transform_log, index=index),
+                  functools.partial(log_rows, index=index),
+                  log_stager.listing_cache)
 
 
-def main():
+def resumable(stagers):
+    """
+    Returns True if a checkpointed copy to one of the stagers' tables
+    failed and can be resumed (see Stager.copy_checkpointed).
+    """
+    try:
+        conn = db.connect()
+    except psycopg2.OperationalError:
+        return False  # no database yet
+    try:
+        with conn.cursor() as cur:
+            return any(s.has_progress(cur) for s in stagers)
+    finally:
+        conn.close()
+
+
+def main(workers=None, incremental=False, shards=None, binary=False,
+         metrics_path=None, profile=False, ddl_workers=None,
+         concurrent_inserts=False, resolve_songs=False, pipeline_depth=None,
+         checkpoint=None, dedup_dimensions=False, reuse_schema=False,
+         shadow=False, partitioned=(), trace_memory=False, listing_cache=None):
     """
     Run script creating and loading Postgres database from data directory.
 
+    If workers is given, the .json files are transformed by a pool of
+    that many processes while copying.
+
+    If shards is given, each staging table is copied over that many
+    connections at once (see Stager.copy_sharded).
+
+    If binary=True, the staging tables are copied in PostgreSQL's
+    binary format (see pgcopy.py) instead of as text.
+
+    If incremental=True, the database is not dropped: only files that
+    are new or changed since the last run (according to the manifest
+    table) are staged, and they are upserted into the star schema.
+    The database must have been created by create_tables.py first.
+    Packs (see pack.py) can't be loaded incrementally: Manifest.changed_files
+    raises ValueError.
+
+    Each stage (copy, and each insert, foreign key and index query) is
+    measured, and written as a JSON line to metrics_path (appended),
+    or to stderr (see metrics.py). With trace_memory=True, the peak
+    memory of each stage is measured too, which slows the stages down.
+
+    If concurrent_inserts=True, the dimension inserts run concurrently
+    on separate connections, then songplays, with one commit at the end,
+    and the timings of the inserts are printed (see scheduler.py).
+    Not used with incremental=True, since the songplays upsert reads the
+    songs and artists tables written by the other inserts.
+
+    If resolve_songs=True, an in-memory index of the songs is built while
+    copying song_staging, and the log transform uses it to add song_id
+    and artist_id to log_staging, so songplays are inserted without a
+    join (see song_index.py). Not used with incremental=True, since
+    only the new songs are staged then.
+
+    If pipeline_depth is given, each transform runs in its own thread and
+    feeds COPY through a queue of that many chunks; the queue statistics
+    are added to the copy metrics (see staging.Pipeline).
+
+    If checkpoint is given, the staging tables are copied in batches of
+    that many files, each committed with the files it copied (see
+    Stager.copy_checkpointed). If a run fails, the staging tables and
+    their progress are kept, and the next run with checkpoint resumes
+    the copy instead of creating the database again. Copies are not
+    sharded then, and resolve_songs is not used, since the song index
+    would miss the songs copied before the failure. The inserts run one
+    after the other on one connection, and the progress is cleared in
+    the transaction of the songplays insert, so a rerun after it
+    committed starts again instead of inserting the songplays twice.
+
+    If dedup_dimensions=True, the distinct time rows and the latest row
+    of each user are collected from the log rows while copying, and
+    copied to their own staging tables, from which time and users are
+    inserted; log_staging only gets the columns songplays needs (see
+    dimensions.py). Not used with checkpoint, since the collected rows
+    of the files copied before a failure would be lost.
+
+    If reuse_schema=True and the database exists, it is not created
+    again: tables matching create_table_queries are truncated, and the
+    others are recreated (see create_tables.reset_tables). Staging tables
+    left by an earlier run are dropped.
+
+    If shadow=True, the star schema is built in the schema 'shadow',
+    including its foreign keys and indices, and then swapped in for the
+    tables in public in one transaction, so readers keep using the old
+    tables until the new ones are complete (see create_tables.swap_shadow).
+    Not used with incremental=True or checkpoint.
+
+    If partitioned is given (e.g. ['songplays'] or ['songplays', 'time']),
+    those tables are partitioned by month of start_time, and the
+    partitions for the months of the staged events are created before
+    the inserts. songplays is then inserted into each of its partitions
+    concurrently (like concurrent_inserts, unless incremental=True or
+    checkpoint), and with ddl_workers, its indices are built per
+    partition concurrently (see scheduler.partition_index_tasks). Old months can be detached or
+    attached with create_tables.detach_partition and attach_partition.
+
+    If ddl_workers is given, the foreign keys and indices are set
+    concurrently over that many connections (see scheduler.py).
+
+    If profile=True, the copy steps are also run under cProfile.
+
+    If listing_cache (a directory) is given, each staging table's input
+    directory listings are cached in it between runs (see
+    staging.discover), so directories that did not change aren't listed
+    again. Files rewritten in place in such directories are not noticed.
+
     Steps:
     1. Run create_tables.py to create Postgress database 'sparkifydb' and
     star schema with tables: songplays, users, time, artists, songs.
@@ -94,71 +349,244 @@ def main():
 
     3. Create staging tables song_staging and log_staging.
 
-    4. Create profilers.
+    4. Create profilers, if profile=True.
 
     5. In the body of `try`:
-    - copy data to staging tables using profilers.
+    - copy data to staging tables (using profilers).
     - insert data into star schema
     - set foreign keys and indices
+    - refresh the rollups for the days of the staged events
     - execute a simple query to check if at least one entry in
     `songplays` has a non-null artist_id
 
-    6. In the body of `finally`: drop the staging tables and 
-    close the connection.
+    6. In the body of `finally`: drop the staging tables (unless a
+    checkpointed copy failed) and close the connection.
 
-    7. Print the profiling statistics, showing the top 10% of
-    operations sorted by time.
+    7. If profile=True, print the profiling statistics, showing the
+    top 10% of operations sorted by time.
     """
+    out = open(metrics_path, 'a') if metrics_path else sys.stderr
+    metrics = Metrics(out, trace_memory=trace_memory, workers=workers, shards=shards,
+                      binary=binary, incremental=incremental)
 
-    create_tables.main()
-    
-    dsn = "host=127.0.0.1 dbname=sparkifydb user=student password=student"
-    conn = psycopg2.connect(dsn)
+    index = None
+    if resolve_songs and not incremental and not checkpoint:
+        index = SongIndex(song_cols.keys())
+        stagers = [song_stager, resolved_log_stager(index)]
+        taps = [index.tap, None]
+    else:
+        stagers = [song_stager, log_stager]
+        taps = [None, None]
+
+    dimensions = None
+    if dedup_dimensions and not checkpoint:
+        log = stagers[1]
+        dimensions = DimensionCollector(log.get_columns())
+        stagers[1] = Stager(log.filepath, log.table_name,
+                            {k: log.columns[k] for k in dimensions.lean_columns},
+                            log.transformer, log.row_transformer, log.listing_cache)
+        taps[1] = dimensions.tap
+
+    if listing_cache:
+        os.makedirs(listing_cache, exist_ok=True)
+        stagers = [Stager(s.filepath, s.table_name, s.columns, s.transformer,
+                          s.row_transformer,
+                          os.path.join(listing_cache, s.get_table_name() + '.listing.json'))
+                   for s in stagers]
+
+    shadow = shadow and not incremental and not checkpoint
+    resume = bool(checkpoint) and resumable(stagers)
+    if resume:
+        print('* Resuming checkpointed copy')
+    elif shadow:
+        with metrics.stage('create shadow tables'):
+            create_tables.create_shadow(partitioned=partitioned)
+    elif not incremental:
+        with metrics.stage('create tables'):
+            create_tables.main(reuse=reuse_schema, partitioned=partitioned)
+
+    # in a shadow load, unqualified tables are created and found in the shadow schema
+    connect = db.connect
+    if shadow:
+        connect = functools.partial(
+            db.connect, search_path=create_tables.shadow_schema + ', public')
+
+    conn = connect()
     cur = conn.cursor()
 
-    stagers = [song_stager, log_stager]
+    manifest = Manifest()
+    files = [None for _ in stagers]
+    if incremental:
+        create_tables.create_tables(cur, conn, partitioned)
+        manifest.create_table(cur)
+        with metrics.stage('manifest'):
+            files = [manifest.changed_files(cur, s.filepath) for s in stagers]
+        conn.commit()
+        for s, entries in zip(stagers, files):
+            print('*', len(entries), 'new or changed files for', s.get_table_name())
     
+    if reuse_schema and not resume:
+        for s in stagers:
+            s.drop_table(cur, if_exists=True)
+        if dimensions is not None:
+            dimensions.drop_tables(cur)
+        conn.commit()
     for s in stagers:
         print('* Creating table', s.get_table_name())
-        s.create_table(cur)
+        # checkpointed batches must survive a server crash, like their progress
+        s.create_table(cur, if_not_exists=resume, logged=bool(checkpoint))
+        conn.commit()
+    if dimensions is not None:
+        dimensions.create_tables(cur)
         conn.commit()
-        
 
-    profilers = [Profile(), Profile()]
+    profilers = [Profile() if profile else None for _ in stagers]
+    keep_staging = bool(checkpoint)
     try:
-        for p, s in zip(profilers, stagers):
+        for p, s, entries, tap in zip(profilers, stagers, files, taps):
             print('* Copying to table', s.get_table_name())
-            p.runcall(lambda: s.copy(cur, stream=True))
-            conn.commit()
+            paths = None if entries is None else [e[0] for e in entries]
+            # the song index reads text rows
+            s_binary = binary and tap is None
+            if checkpoint:
+                copy = lambda: s.copy_checkpointed(conn, checkpoint, workers=workers,
+                                                   files=paths, binary=s_binary,
+                                                   pipeline_depth=pipeline_depth)
+            elif shards:
+                # shard by the sizes the manifest already has
+                infos = None if entries is None else [FileInfo(*e[:3]) for e in entries]
+                copy = lambda: s.copy_sharded(connect, shards, workers=workers,
+                                              files=infos, binary=s_binary, tap=tap)
+            else:
+                copy = lambda: s.copy(cur, stream=True, workers=workers,
+                                      files=paths, binary=s_binary, tap=tap,
+                                      pipeline_depth=pipeline_depth)
+            with metrics.stage('copy ' + s.get_table_name()) as record:
+                record['bytes'] = p.runcall(copy) if p else copy()
+                if not shards and not checkpoint:
+                    record['rows'] = cur.rowcount
+                    if pipeline_depth:
+                        record['pipeline'] = s.pipeline_stats
+                conn.commit()
+        if dimensions is not None:
+            print('* Copying to tables time_staging and user_staging')
+            with metrics.stage('copy dimensions') as record:
+                record['rows'] = dimensions.copy(cur)
+                conn.commit()
+        if index is not None:
+            print('* Song index: {} songs, {:.1f} MB'.format(
+                len(index), index.memory_footprint() / (1 << 20)))
+
+        created = {}
+        if partitioned:
+            with metrics.stage('create partitions') as record:
+                months = create_tables.staged_months(cur)
+                created = {t: create_tables.create_partitions(cur, t, months)
+                           for t in partitioned}
+                conn.commit()
+                record['rows'] = len(months)
+            print('* Partitions for', ', '.join('{:%Y-%m}'.format(m) for m in months))
 
         print('* Inserting into star schema')
-        for query in sql_queries.insert_queries:
-            cur.execute(query)
-            conn.commit()
-        print('* Setting foreign keys')
-        for query in sql_queries.fk_queries:
-            cur.execute(query)
-            conn.commit()
-        print('* Setting indices')
-        for query in sql_queries.idx_queries:
-            cur.execute(query)
+        if incremental:
+            insert_queries = sql_queries.upsert_queries
+        elif index is not None:
+            insert_queries = sql_queries.resolved_insert_queries
+        else:
+            insert_queries = sql_queries.insert_queries
+        if dimensions is not None:
+            insert_queries = [sql_queries.dedup_queries.get(q, q) for q in insert_queries]
+        if (concurrent_inserts or partitioned) and not incremental and not checkpoint:
+            tasks = scheduler.insert_tasks(insert_queries, created.get('songplays'))
+            timings = scheduler.run_in_transaction(tasks, connect, metrics=metrics)
+            scheduler.print_timings(tasks, timings)
+        else:
+            for query in insert_queries:
+                with metrics.stage(query_name(query)) as record:
+                    cur.execute(query)
+                    record['rows'] = cur.rowcount
+                    if checkpoint and query is insert_queries[-1]:
+                        # songplays (inserted last) consumes the staged data:
+                        # once it commits, a rerun must not resume from it
+                        for s in stagers:
+                            s.clear_progress(cur)
+                        keep_staging = False
+                    conn.commit()
+        if ddl_workers:
+            print('* Setting foreign keys and indices')
+            # on a new schema, the partitions are indexed one by one;
+            # partitions added to an indexed table get its indices already
+            partitions = None
+            if partitioned and not incremental:
+                partitions = {t: create_tables.partitions(cur, t) for t in partitioned}
+            tasks = scheduler.post_load_tasks(sql_queries.fk_queries, sql_queries.idx_queries,
+                                              partitions)
+            scheduler.run_ddl(tasks, connect, ddl_workers, metrics)
+        else:
+            print('* Setting foreign keys')
+            for query in sql_queries.fk_queries:
+                try:
+                    with metrics.stage(query_name(query)):
+                        cur.execute(query)
+                except psycopg2.errors.DuplicateObject:
+                    # constraint was set by an earlier incremental run
+                    conn.rollback()
+                else:
+                    conn.commit()
+            print('* Setting indices')
+            for query in sql_queries.idx_queries:
+                with metrics.stage(query_name(query)):
+                    cur.execute(query)
+                    conn.commit()
+
+        # after the indices: the refresh reads songplays by day ranges of start_time
+        print('* Refreshing rollups')
+        for query in sql_queries.rollup_refresh_queries:
+            with metrics.stage(query_name(query)) as record:
+                cur.execute(query)
+                record['rows'] = cur.rowcount
+        conn.commit()
+        if incremental:
+            for entries in files:
+                manifest.record(cur, entries)
             conn.commit()
 
+        if shadow:
+            print('* Swapping in the shadow tables')
+            with metrics.stage('swap shadow tables'):
+                create_tables.swap_shadow(cur, conn)
+
         cur.execute("SELECT COUNT(*) FROM songplays WHERE artist_id IS NOT NULL;")
         print('* Number of songplays with artist_id not NULL:', cur.fetchone()[0])
     finally:
-        for s in stagers:
-            print('* Dropping table', s.get_table_name())
-            s.drop_table(cur)
-            conn.commit()
+        if keep_staging:
+            conn.rollback()
+            print('* Keeping staging tables to resume the copy')
+        else:
+            for s in stagers:
+                print('* Dropping table', s.get_table_name())
+                s.drop_table(cur)
+                conn.commit()
+            if dimensions is not None:
+                dimensions.drop_tables(cur)
+                conn.commit()
         cur.close()
         conn.close()
+        if metrics_path:
+            out.close()
         
     for profiler in profilers:
-        stats = Stats(profiler)
-        stats.strip_dirs()
-        stats.sort_stats('time')
-        stats.print_stats(.1)
+        if profiler:
+            stats = Stats(profiler)
+            stats.strip_dirs()
+            stats.sort_stats('time')
+            stats.print_stats(.1)
+    if not workers:
+        # with workers, the transforms (and their caches) ran in the pool's processes;
+        # text rows use time_text (which calls time_columns on a miss), binary rows
+        # time_columns
+        print('* time_text cache:', time_text.cache_info())
+        print('* time_columns cache:', time_columns.cache_info())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,148 @@
+"""
+Generates a synthetic Sparkify dataset: song_data and log_data trees
+with the same .json shapes as the sample data, at any scale.
+
+The output only depends on the arguments, so runs are repeatable.
+
+Usage: python generate_data.py OUT [--songs N] [--events N] [--days N] [--seed N]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import string
+
+
+_ID_CHARS = string.ascii_uppercase + string.digits
+_PAGES = ['NextSong'] * 8 + ['Home', 'Logout', 'Settings', 'About']
+_AGENTS = ['"Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) '
+           'Chrome/36.0.1985.143 Safari/537.36"',
+           '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.78.2 '
+           '(KHTML, like Gecko) Version/7.0.6 Safari/537.78.2"',
+           'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0']
+_LOCATIONS = ['San Francisco-Oakland-Hayward, CA', 'New York-Newark-Jersey City, NY-NJ-PA',
+              'Atlanta-Sandy Springs-Roswell, GA', 'Chicago-Naperville-Elgin, IL-IN-WI',
+              'Portland-South Portland, ME', '']
+_FIRST = ['Walter', 'Kaylee', 'Ryan', 'Jayden', 'Lily', 'Tegan', 'Jacob', 'Chloe']
+_LAST = ['Frye', 'Summers', 'Smith', 'Bell', 'Koch', 'Levine', 'Klein', 'Cuevas']
+
+
+def random_id(rng, prefix):
+    return prefix + ''.join(rng.choice(_ID_CHARS) for _ in range(16))
+
+
+def make_artists(rng, n):
+    artists = []
+    for i in range(n):
+        located = rng.random() < 0.4
+        artists.append({'artist_id': random_id(rng, 'AR'),
+                        'artist_name': 'Artist {}'.format(i),
+                        'artist_location': rng.choice(_LOCATIONS),
+                        'artist_latitude': round(rng.uniform(-60, 70), 5) if located else None,
+                        'artist_longitude': round(rng.uniform(-170, 170), 5) if located else None})
+    return artists
+
+
+def write_songs(rng, root, n_songs, artists):
+    """
+    Writes one .json file per song under root/song_data/X/Y/Z/,
+    and returns the list of (title, artist_name, duration) of the songs.
+    """
+    songs = []
+    for i in range(n_songs):
+        artist = rng.choice(artists)
+        track_id = random_id(rng, 'TR')
+        song = {'num_songs': 1, **artist,
+                'song_id': random_id(rng, 'SO'),
+                'title': 'Song {}'.format(i),
+                'duration': round(rng.uniform(60, 600), 5),
+                'year': rng.choice([0, rng.randint(1950, 2018)])}
+        directory = os.path.join(root, 'song_data', *track_id[2:5])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, track_id + '.json'), 'w') as f:
+            json.dump(song, f)
+        songs.append((song['title'], song['artist_name'], song['duration']))
+    return songs
+
+
+def make_users(rng, n):
+    return [{'userId': str(i + 1),
+             'firstName': rng.choice(_FIRST),
+             'lastName': rng.choice(_LAST),
+             'gender': rng.choice('MF'),
+             'level': rng.choice(['free', 'paid']),
+             'location': rng.choice(_LOCATIONS[:-1]),
+             'userAgent': rng.choice(_AGENTS),
+             'registration': 1540000000000.0 + rng.randint(0, 10 ** 9)} for i in range(n)]
+
+
+def write_logs(rng, root, n_events, days, songs, users, start=datetime.date(2018, 11, 1)):
+    """
+    Writes n_events events, spread over days files named
+    root/log_data/YYYY/MM/YYYY-MM-DD-events.json, one .json object per line.
+    """
+    per_day, extra = divmod(n_events, days)
+    session = 0
+    for d in range(days):
+        date = start + datetime.timedelta(days=d)
+        directory = os.path.join(root, 'log_data', str(date.year), '{:02d}'.format(date.month))
+        os.makedirs(directory, exist_ok=True)
+        # midnight UTC, so ts doesn't depend on the local timezone
+        day_start = datetime.datetime(date.year, date.month, date.day,
+                                      tzinfo=datetime.timezone.utc).timestamp() * 1000
+        n = per_day + (d < extra)
+        times = sorted(rng.randint(0, 86399999) for _ in range(n))
+        with open(os.path.join(directory, '{}-events.json'.format(date)), 'w') as f:
+            for i, ms in enumerate(times):
+                if i % 20 == 0:
+                    session += 1
+                    user = rng.choice(users) if rng.random() < 0.95 else None
+                page = rng.choice(_PAGES)
+                title, artist, length = rng.choice(songs) if page == 'NextSong' else (None, None, None)
+                event = {'artist': artist,
+                         'auth': 'Logged In' if user else 'Logged Out',
+                         'firstName': user and user['firstName'],
+                         'gender': user and user['gender'],
+                         'itemInSession': i % 20,
+                         'lastName': user and user['lastName'],
+                         'length': length,
+                         'level': user['level'] if user else 'free',
+                         'location': user and user['location'],
+                         'method': 'PUT' if page == 'NextSong' else 'GET',
+                         'page': page,
+                         'registration': user and user['registration'],
+                         'sessionId': session,
+                         'song': title,
+                         'status': 200,
+                         'ts': int(day_start + ms),
+                         'userAgent': user and user['userAgent'],
+                         'userId': user['userId'] if user else ''}
+                f.write(json.dumps(event) + '\n')
+
+
+def generate(root, n_songs=1000, n_events=1000, days=30, n_users=100, seed=0):
+    """
+    Writes a synthetic dataset to root/song_data and root/log_data.
+    """
+    rng = random.Random(seed)
+    artists = make_artists(rng, max(1, n_songs // 3))
+    songs = write_songs(rng, root, n_songs, artists)
+    users = make_users(rng, n_users)
+    write_logs(rng, root, n_events, days, songs, users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('--songs', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out, args.songs, args.events, args.days, args.users, args.seed)
+
+
+if __name__ == '__main__':
+    main()
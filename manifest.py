@@ -0,0 +1,78 @@
+import hashlib
+from psycopg2.extras import execute_values
+import sql_queries
+from sources import JSON_SUFFIXES, is_pack
+from staging import discover
+
+
+def file_hash(filepath, blocksize=1 << 20):
+    """
+    Returns the SHA-256 hex digest of the contents of filepath.
+    """
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while (block := f.read(blocksize)):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Records which files have been loaded, in a table with the path,
+    size, mtime and content hash of each file.
+
+    Used for incremental loads: `changed_files` returns only the files
+    that are new or whose contents changed since they were recorded,
+    and `record` marks them as loaded.
+
+    Attributes
+    ----------
+
+    table_name: string, name of the manifest table
+
+    """
+    def __init__(self, table_name='file_manifest'):
+        self.table_name = table_name
+
+    def create_table(self, cur):
+        cur.execute(sql_queries.manifest_table_create.format(self.table_name))
+
+    def changed_files(self, cur, filepath):
+        """
+        Returns a list of (path, size, mtime, hash) tuples for the .json
+        files in filepath that are not in the manifest, or that differ
+        from their entry.
+
+        Files are only hashed if their size or mtime changed, and files
+        that were touched but have the same hash are not returned.
+
+        Raises ValueError if filepath is a pack: its members are not
+        files the manifest can compare (pack.py only appends the new or
+        changed files anyway), so load packs without incremental.
+        """
+        if is_pack(filepath):
+            raise ValueError('incremental loads need a directory of .json files, '
+                             'not a pack: {}'.format(filepath))
+        cur.execute('SELECT path, size, mtime, hash FROM {};'.format(self.table_name))
+        recorded = {row[0]: row[1:] for row in cur.fetchall()}
+
+        changed = []
+        touched = []
+        for path, size, mtime in discover(filepath, JSON_SUFFIXES):
+            old = recorded.get(path)
+            if old and old[:2] == (size, mtime):
+                continue
+            entry = (path, size, mtime, file_hash(path))
+            if old and old[2] == entry[3]:
+                touched.append(entry)
+            else:
+                changed.append(entry)
+        self.record(cur, touched)
+        return changed
+
+    def record(self, cur, entries):
+        """
+        Upserts (path, size, mtime, hash) tuples into the manifest.
+        """
+        if entries:
+            execute_values(cur, sql_queries.manifest_upsert.format(self.table_name), entries)
@@ -0,0 +1,153 @@
+"""
+Lightweight per-stage instrumentation for the ETL.
+
+Each stage records wall time, CPU time (of this process and of finished
+worker processes), rows, bytes and memory, and is written out as
+one JSON object per line.
+"""
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def query_name(query):
+    """
+    Returns a short name for a query from sql_queries.py, e.g.
+    'insert songplays', 'fk fk__songplays__time' or 'index idx_user_id'.
+    """
+    patterns = [(r'INSERT\s+INTO\s+(\w+)', 'insert'),
+                (r'DELETE\s+FROM\s+(\w+)', 'delete'),
+                (r'CREATE\s+TEMP\s+TABLE\s+(\w+)', 'create'),
+                (r'ADD\s+CONSTRAINT\s+(\w+)', 'fk'),
+                (r'VALIDATE\s+CONSTRAINT\s+(\w+)', 'validate'),
+                (r'CREATE\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', 'index')]
+    for pattern, kind in patterns:
+        if (m := re.search(pattern, query, re.IGNORECASE)):
+            return kind + ' ' + m.group(1)
+    return ' '.join(query.split())[:40]
+
+
+def _cpu_seconds():
+    self_ = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_.ru_utime + self_.ru_stime,
+            children.ru_utime + children.ru_stime)
+
+
+def _rss_bytes():
+    """Returns the resident set size of this process, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class RssSampler:
+    """
+    Samples the resident set size of this process from a thread every
+    interval seconds, keeping the peak, until stop() returns it (in bytes,
+    or None where the RSS can't be read, e.g. outside Linux).
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self.peak is not None and not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes() or 0)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return None if self.peak is None else max(self.peak, _rss_bytes() or 0)
+
+
+def _mb(nbytes):
+    return None if nbytes is None else nbytes / (1 << 20)
+
+
+class Metrics:
+    """
+    Measures stages of the ETL and writes a JSON line for each.
+
+    Usage:
+
+        metrics = Metrics(open('metrics.jsonl', 'a'), run='nightly')
+        with metrics.stage('copy log_staging') as record:
+            record['bytes'] = log_stager.copy(cur)
+
+    The fields of each line are: time, stage, wall_s, cpu_s,
+    children_cpu_s, rows, bytes, rss_mb (at the end of the stage),
+    max_rss_mb (the high-water mark of the process so far), error (if
+    the stage raised), any tags given to Metrics or stage(), and with
+    trace_memory=True, the peaks during the stage of the resident set
+    size, peak_rss_mb (sampled, see RssSampler), and of Python
+    allocations, peak_traced_mb (which slows the stage down). Stages
+    running at the same time share these peaks.
+
+    Attributes
+    ----------
+
+    out: file-like object the JSON lines are written to
+
+    trace_memory: bool, whether to trace Python allocations
+
+    tags: dict, fields added to every line
+
+    records: list of the records written so far
+
+    """
+    def __init__(self, out=sys.stderr, trace_memory=False, **tags):
+        self.out = out
+        self.trace_memory = trace_memory
+        self.tags = tags
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **tags):
+        """
+        Measures the body of the with statement as stage name. Yields
+        a dict, in which the body can set 'rows' and 'bytes'.
+        """
+        record = {'stage': name, 'rows': None, 'bytes': None, **tags}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            sampler = RssSampler()
+        cpu, children_cpu = _cpu_seconds()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = repr(e)
+            raise
+        finally:
+            record['wall_s'] = time.perf_counter() - start
+            end_cpu, end_children_cpu = _cpu_seconds()
+            record['cpu_s'] = end_cpu - cpu
+            record['children_cpu_s'] = end_children_cpu - children_cpu
+            record['rss_mb'] = _mb(_rss_bytes())
+            record['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            if self.trace_memory:
+                record['peak_rss_mb'] = _mb(sampler.stop())
+                record['peak_traced_mb'] = _mb(tracemalloc.get_traced_memory()[1])
+            self.emit(record)
+
+    def emit(self, record):
+        line = {'time': time.time(), **self.tags, **record}
+        with self._lock:
+            self.records.append(line)
+            self.out.write(json.dumps(line) + '\n')
+            self.out.flush()
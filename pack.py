@@ -0,0 +1,67 @@
+"""
+Packs a directory of .json files into a single file, so they can be
+staged without opening each file (see sources.py).
+
+A pack is two files: NAME.pack, the contents of the files one after
+the other (decompressed, and each ending with a newline, so a pack of
+.json objects is itself newline-delimited JSON), and NAME.pack.idx,
+a line of JSON per file with its path, offset and length in the pack,
+size and mtime.
+
+Packs can be appended to: running pack again only adds the files that
+are new, or whose size or mtime changed, since they were packed.
+A Stager reads a pack if its filepath is the path of the NAME.pack file.
+
+Usage: python pack.py SOURCE_DIR NAME.pack
+"""
+import argparse
+import json
+import os
+from sources import index_path, read_index, open_file
+from staging import extract
+
+
+def pack(filepath, pack_path):
+    """
+    Appends the .json files in filepath that are not yet in the pack
+    at pack_path (or have changed since) to the pack, creating it if
+    needed. Returns the number of files added.
+    """
+    packed = read_index(pack_path)
+    entries = []
+    with open(pack_path, 'ab') as blob:
+        offset = blob.seek(0, os.SEEK_END)
+        for path in extract(filepath):
+            st = os.stat(path)
+            old = packed.get(path)
+            if old and (old['size'], old['mtime']) == (st.st_size, st.st_mtime):
+                continue
+            with open_file(path, 'rb') as f:
+                data = f.read()
+            if not data.endswith(b'\n'):
+                data += b'\n'
+            blob.write(data)
+            entries.append({'path': path, 'offset': offset, 'length': len(data),
+                            'size': st.st_size, 'mtime': st.st_mtime})
+            offset += len(data)
+        blob.flush()
+        os.fsync(blob.fileno())
+    # the index is only written once the data it points to is on disk
+    with open(index_path(pack_path), 'a') as index:
+        for entry in entries:
+            index.write(json.dumps(entry) + '\n')
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help='directory of .json files')
+    parser.add_argument('pack', help='path of the pack, ending in .pack')
+    args = parser.parse_args()
+    if not args.pack.endswith('.pack'):
+        parser.error('the pack path must end in .pack')
+    print('* Added', pack(args.source, args.pack), 'files to', args.pack)
+
+
+if __name__ == '__main__':
+    main()
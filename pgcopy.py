@@ -0,0 +1,134 @@
+"""
+Encoder for PostgreSQL's binary COPY format (PGCOPY).
+
+Rows are tuples of Python values, encoded according to the data types
+of a Stager's columns, so they reach the server without being formatted
+as text and parsed again. None is encoded as NULL.
+
+Supported types: TEXT, INTEGER / INT, DECIMAL, TIMESTAMP and BOOLEAN.
+"""
+import datetime
+import struct
+from decimal import Decimal
+
+
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+
+_NULL = struct.pack('!i', -1)
+_int4 = struct.Struct('!ii')
+_int8 = struct.Struct('!iq')
+_numeric_header = struct.Struct('!ihhHh')
+_PG_EPOCH = datetime.datetime(2000, 1, 1)
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+
+
+def encode_text(value):
+    data = str(value).encode()
+    return struct.pack('!i', len(data)) + data
+
+
+def encode_integer(value):
+    return _int4.pack(4, value)
+
+
+def encode_boolean(value):
+    return b'\x00\x00\x00\x01\x01' if value else b'\x00\x00\x00\x01\x00'
+
+
+def encode_timestamp(value):
+    """
+    Encodes a naive datetime as microseconds since 2000-01-01.
+    """
+    delta = value - _PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return _int8.pack(8, micros)
+
+
+def encode_decimal(value):
+    """
+    Encodes a Decimal, int or float as a numeric: a header with the
+    number of digits, weight, sign and display scale, followed by
+    the digits in base 10000.
+    """
+    if not isinstance(value, Decimal):
+        value = Decimal(repr(value) if isinstance(value, float) else value)
+    if value.is_nan():
+        return _numeric_header.pack(8, 0, 0, _NUMERIC_NAN, 0)
+    if value.is_infinite():
+        raise ValueError('cannot encode infinite numeric: {}'.format(value))
+
+    sign, digits, exp = value.as_tuple()
+    dscale = max(-exp, 0)
+    s = ''.join(map(str, digits)) + '0' * max(exp, 0)
+    n_int = len(s) + min(exp, 0)  # number of digits before the point
+    if n_int < 0:
+        s = '0' * -n_int + s
+        n_int = 0
+    intpart = s[:n_int].zfill(-(-n_int // 4) * 4)
+    frac = s[n_int:]
+    frac += '0' * (-len(frac) % 4)
+
+    s = intpart + frac
+    groups = [int(s[i:i + 4]) for i in range(0, len(s), 4)]
+    weight = len(intpart) // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    n = len(groups)
+    return (_numeric_header.pack(8 + 2 * n, n, weight,
+                                 _NUMERIC_NEG if sign else 0, dscale)
+            + struct.pack('!%dH' % n, *groups))
+
+
+encoders = {'TEXT': encode_text,
+            'INTEGER': encode_integer,
+            'INT': encode_integer,
+            'DECIMAL': encode_decimal,
+            'TIMESTAMP': encode_timestamp,
+            'BOOLEAN': encode_boolean}
+
+
+def get_encoders(types):
+    """
+    Returns the encoder for each data type in types.
+    """
+    try:
+        return [encoders[t.upper()] for t in types]
+    except KeyError as e:
+        raise ValueError('no binary encoder for data type {}'.format(e)) from None
+
+
+def encode_row(row, row_encoders):
+    """
+    Encodes a tuple of values as a PGCOPY tuple.
+    """
+    if len(row) != len(row_encoders):
+        raise ValueError('expected {} values, got {}'.format(len(row_encoders), len(row)))
+    return struct.pack('!h', len(row)) + b''.join(
+        _NULL if v is None else enc(v) for v, enc in zip(row, row_encoders))
+
+
+class RowEncoder:
+    """
+    Wraps a row transformer (a function taking a filepath and yielding
+    tuples of values) so that it yields the rows in PGCOPY format.
+
+    Instances are picklable if the row transformer is, so they can be
+    used as a Stager's transformer in worker processes.
+    """
+    def __init__(self, row_transformer, types):
+        self.row_transformer = row_transformer
+        self.types = list(types)
+        self._encoders = get_encoders(self.types)
+
+    def __call__(self, filepath):
+        row_encoders = self._encoders
+        for row in self.row_transformer(filepath):
+            yield encode_row(row, row_encoders)
@@ -0,0 +1,319 @@
+"""
+Runs SQL statements as a dependency graph, with independent statements
+running concurrently on a small pool of connections.
+
+Used for the post-load DDL: foreign keys are added as NOT VALID (which
+only updates the catalog), then the index builds and the constraint
+validations (which scan the tables) run concurrently.
+
+Also used for the star schema inserts: the dimension inserts run
+concurrently on separate connections, then songplays, and all of them
+commit together.
+"""
+import queue
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import psycopg2
+from db import ConnectionGroup
+
+
+class Task:
+    """
+    A named SQL statement that runs after the tasks named in deps.
+    """
+    def __init__(self, name, query, deps=()):
+        self.name = name
+        self.query = query
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return 'Task({!r}, deps={!r})'.format(self.name, self.deps)
+
+
+def check_tasks(tasks):
+    """
+    Raises ValueError if task names are not unique, a dependency
+    is unknown, or the dependencies have a cycle.
+    """
+    names = [t.name for t in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError('duplicate task names: {}'.format(
+            sorted({n for n in names if names.count(n) > 1})))
+    remaining = {t.name: set(t.deps) for t in tasks}
+    for t in tasks:
+        if not remaining[t.name] <= remaining.keys():
+            raise ValueError('unknown dependencies of {}: {}'.format(
+                t.name, sorted(remaining[t.name] - remaining.keys())))
+    while remaining:
+        ready = [n for n, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError('dependency cycle between: {}'.format(sorted(remaining)))
+        for n in ready:
+            del remaining[n]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_tasks(tasks, execute, workers):
+    """
+    Calls execute(task) for each task, from a pool of workers threads,
+    starting each task as soon as its dependencies have finished.
+    If a task raises, no more tasks are started and the error is raised.
+
+    Returns a dict of task name: (start, end), in seconds since the
+    first task started.
+    """
+    check_tasks(tasks)
+    by_name = {t.name: t for t in tasks}
+    remaining = {t.name: set(t.deps) for t in tasks}
+    dependents = defaultdict(list)
+    for t in tasks:
+        for dep in t.deps:
+            dependents[dep].append(t.name)
+
+    t0 = time.perf_counter()
+
+    def run(task):
+        start = time.perf_counter() - t0
+        execute(task)
+        return start, time.perf_counter() - t0
+
+    timings = {}
+    ready = [t.name for t in tasks if not t.deps]
+    running = {}
+    with ThreadPoolExecutor(workers) as pool:
+        while ready or running:
+            for name in ready:
+                running[pool.submit(run, by_name[name])] = name
+            ready = []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                timings[name] = future.result()
+                for dependent in dependents[name]:
+                    remaining[dependent].discard(name)
+                    if not remaining[dependent]:
+                        ready.append(dependent)
+    return timings
+
+
+def critical_path(tasks, timings):
+    """
+    Returns the chain of tasks that determined the total run time:
+    starting from the task that finished last, each task is preceded
+    by the dependency that finished last.
+    """
+    by_name = {t.name: t for t in tasks}
+    name = max(timings, key=lambda n: timings[n][1])
+    path = [name]
+    while by_name[name].deps:
+        name = max(by_name[name].deps, key=lambda n: timings[n][1])
+        path.append(name)
+    return path[::-1]
+
+
+def print_timings(tasks, timings):
+    """
+    Prints the start, end and duration of each task, and the critical path.
+    """
+    for name, (start, end) in sorted(timings.items(), key=lambda item: item[1]):
+        print('  {:<40} {:>8.3f} {:>8.3f} {:>8.3f}'.format(name, start, end, end - start))
+    path = critical_path(tasks, timings)
+    print('  critical path ({:.3f}s): {}'.format(timings[path[-1]][1], ' -> '.join(path)))
+
+
+def index_names(queries):
+    """
+    Returns the index names created by CREATE INDEX queries, raising
+    ValueError if two queries create an index with the same name
+    (the second would silently be skipped by IF NOT EXISTS).
+    """
+    names = {}
+    for query in queries:
+        m = re.search(r'CREATE\s+INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)',
+                      query, re.IGNORECASE)
+        name, table = m.groups()
+        if name in names:
+            raise ValueError('index {} defined on both {} and {}'.format(
+                name, names[name], table))
+        names[name] = table
+    return list(names)
+
+
+def partition_index_tasks(query, partitions, deps=()):
+    """
+    Returns the tasks building the index of a CREATE INDEX query on a
+    partitioned table one partition at a time, so the partitions are
+    indexed concurrently: the index is created on the partitioned table
+    only (invalid until every partition is attached), each partition
+    is indexed, and each partition's index is attached to it.
+    """
+    name, table, definition = re.search(
+        r'CREATE\s+INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)\s*(.*?);?\s*$',
+        query, re.IGNORECASE | re.DOTALL).groups()
+    tasks = [Task('index ' + name, 'CREATE INDEX IF NOT EXISTS {} ON ONLY {} {};'.format(
+        name, table, definition), deps)]
+    for partition in partitions:
+        child = '{}_{}'.format(partition, name)
+        tasks.append(Task('index ' + child, 'CREATE INDEX IF NOT EXISTS {} ON {} {};'.format(
+            child, partition, definition), deps))
+        tasks.append(Task('attach ' + child, 'ALTER INDEX {} ATTACH PARTITION {};'.format(
+            name, child), ('index ' + name, 'index ' + child)))
+    return tasks
+
+
+def post_load_tasks(fk_queries, idx_queries, partitions=None):
+    """
+    Returns the tasks for the foreign keys and indices set after a load.
+
+    Foreign keys are added one after another as NOT VALID, which only
+    takes brief locks. The index builds and the validations of the
+    constraints then run concurrently once all keys are added (the
+    validations of one table still wait for each other's locks).
+
+    partitions is a dict of partitioned table: names of its partitions.
+    The indices of those tables are built per partition (see
+    `partition_index_tasks`), and their foreign keys are validated
+    as they are added, since they cannot be NOT VALID.
+    """
+    partitions = partitions or {}
+    tasks = []
+    constraints = []
+    prev = ()
+    for query in fk_queries:
+        table, name = re.search(r'ALTER\s+TABLE\s+(\w+)\s+ADD\s+CONSTRAINT\s+(\w+)',
+                                query, re.IGNORECASE).groups()
+        if table in partitions:
+            add = query
+        else:
+            add = query.strip().rstrip(';') + ' NOT VALID;'
+            constraints.append((table, name))
+        tasks.append(Task('add ' + name, add, prev))
+        prev = ('add ' + name,)
+    added = [t.name for t in tasks]
+    for table, name in constraints:
+        tasks.append(Task('validate ' + name,
+                          'ALTER TABLE {} VALIDATE CONSTRAINT {};'.format(table, name),
+                          added))
+    for name, query in zip(index_names(idx_queries), idx_queries):
+        table = re.search(r'\s+ON\s+(\w+)', query, re.IGNORECASE).group(1)
+        if table in partitions:
+            tasks.extend(partition_index_tasks(query, partitions[table], added))
+        else:
+            tasks.append(Task('index ' + name, query, added))
+    return tasks
+
+
+def run_ddl(tasks, connect, workers=4, metrics=None):
+    """
+    Runs tasks over a pool of workers connections from connect(),
+    committing after each task. Objects that already exist (e.g. from an
+    earlier incremental run) are left as they are.
+
+    If metrics (a metrics.Metrics) is given, each task is measured.
+    Returns the timings of run_tasks.
+    """
+    pool = queue.Queue()
+    conns = [connect() for _ in range(workers)]
+    for conn in conns:
+        pool.put(conn)
+
+    def execute(task):
+        conn = pool.get()
+        try:
+            with conn.cursor() as cur:
+                if metrics:
+                    with metrics.stage(task.name):
+                        cur.execute(task.query)
+                else:
+                    cur.execute(task.query)
+            conn.commit()
+        except psycopg2.errors.DuplicateObject:
+            conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.put(conn)
+
+    try:
+        return run_tasks(tasks, execute, workers)
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def partition_insert(query, partition, start, end):
+    """
+    Returns an INSERT INTO table (columns) SELECT ... query, changed to
+    insert only the rows with a first column from start to end (dates),
+    directly into the table's partition for that range.
+    """
+    columns, select = re.search(
+        r'INSERT\s+INTO\s+\w+\s*\(([^)]*)\)\s*(SELECT.*?)\s*(?:ON\s+CONFLICT\s+DO\s+NOTHING)?\s*;?\s*$',
+        query, re.IGNORECASE | re.DOTALL).groups()
+    columns = ', '.join(c.strip() for c in columns.split(','))
+    key = columns.split(', ')[0]
+    return ("INSERT INTO {} ({})\nSELECT * FROM ({}) as r ({})\n"
+            "WHERE r.{} >= '{}' AND r.{} < '{}'\nON CONFLICT DO NOTHING;").format(
+                partition, columns, select, columns, key, start, key, end)
+
+
+def insert_tasks(insert_queries, partitions=None):
+    """
+    Returns the tasks for the star schema inserts: songplays runs after
+    all the other (dimension) inserts, which don't depend on each other.
+
+    If partitions, a list of (name, start, end) of partitions of
+    songplays, is given, songplays is inserted by one task for each
+    partition, which run concurrently (see `partition_insert`).
+    """
+    names = [re.search(r'INSERT\s+INTO\s+(\w+)', q, re.IGNORECASE).group(1)
+             for q in insert_queries]
+    dimensions = ['insert ' + n for n in names if n != 'songplays']
+    tasks = []
+    for n, q in zip(names, insert_queries):
+        if n == 'songplays' and partitions:
+            tasks.extend(Task('insert ' + p, partition_insert(q, p, start, end), dimensions)
+                         for p, start, end in partitions)
+        else:
+            tasks.append(Task('insert ' + n, q, dimensions if n == 'songplays' else ()))
+    return tasks
+
+
+def run_in_transaction(tasks, connect, workers=None, two_phase=False, metrics=None):
+    """
+    Runs tasks over workers connections from connect() (by default, one
+    per task without dependencies), and commits all of the connections
+    together at the end, or rolls them all back if a task fails
+    (see db.ConnectionGroup).
+
+    Each task only sees the uncommitted changes of the tasks that ran
+    on the same connection, so tasks must not read each other's tables:
+    this holds for insert_queries, which only read the staging tables.
+
+    If metrics (a metrics.Metrics) is given, each task is measured.
+    Returns the timings of run_tasks.
+    """
+    workers = workers or max(1, sum(1 for t in tasks if not t.deps))
+    with ConnectionGroup(connect, workers, two_phase) as conns:
+        pool = queue.Queue()
+        for conn in conns:
+            pool.put(conn)
+
+        def execute(task):
+            conn = pool.get()
+            try:
+                with conn.cursor() as cur:
+                    if metrics:
+                        with metrics.stage(task.name) as record:
+                            cur.execute(task.query)
+                            record['rows'] = cur.rowcount
+                    else:
+                        cur.execute(task.query)
+            finally:
+                pool.put(conn)
+
+        return run_tasks(tasks, execute, workers)
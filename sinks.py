@@ -0,0 +1,89 @@
+"""
+Sinks for Stager.copy that don't need a database.
+
+A sink is anything with the COPY methods of a psycopg2 cursor that
+Stager.copy uses: copy_from(file, table, columns=..., null=...) for text
+and copy_expert(sql, file) for binary. A psycopg2 cursor is the sink
+that loads into Postgres; the sinks here count or capture the stream,
+so the transform side can be measured on its own.
+"""
+import json
+import os
+import re
+
+
+class NullSink:
+    """
+    Reads and discards COPY streams, counting rows and bytes.
+
+    Rows are counted for text streams only (as newlines); binary
+    streams are counted in bytes.
+    """
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.rows = 0
+        self.bytes = 0
+
+    def _drain(self, file, text):
+        while (data := file.read(self.size)):
+            self.bytes += len(data)
+            if text:
+                self.rows += data.count('\n')
+
+    def copy_from(self, file, table, sep='\t', null='\\N', size=8192, columns=None):
+        self._drain(file, text=True)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._drain(file, text=False)
+
+
+class FileSink:
+    """
+    Writes COPY streams to files in a directory, for later replay
+    into Postgres with `replay`.
+
+    Each stream goes to its own file, named after the table,
+    next to a .json file describing how to copy it.
+    """
+    def __init__(self, dirpath, size=1 << 16):
+        self.dirpath = dirpath
+        self.size = size
+        self.paths = []
+        os.makedirs(dirpath, exist_ok=True)
+
+    def _write(self, file, table, meta):
+        path = os.path.join(self.dirpath, '{}.{}.copy'.format(table, len(self.paths)))
+        if meta['format'] == 'binary':
+            out = open(path, 'wb')
+        else:
+            out = open(path, 'wt', newline='')
+        with out as f:
+            while (data := file.read(self.size)):
+                f.write(data)
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+        self.paths.append(path)
+
+    def copy_from(self, file, table, sep='\t', null='\\N', size=8192, columns=None):
+        meta = {'format': 'text', 'table': table, 'sep': sep, 'null': null,
+                'columns': list(columns) if columns else None}
+        self._write(file, table, meta)
+
+    def copy_expert(self, sql, file, size=8192):
+        table = re.match(r'\s*COPY\s+(\S+)', sql, re.IGNORECASE).group(1)
+        self._write(file, table, {'format': 'binary', 'table': table, 'sql': sql})
+
+
+def replay(cur, path):
+    """
+    Copies a stream written by FileSink into Postgres through cur.
+    """
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    if meta['format'] == 'binary':
+        with open(path, 'rb') as f:
+            cur.copy_expert(meta['sql'], f)
+    else:
+        with open(path, 'rt', newline='') as f:
+            cur.copy_from(f, meta['table'], sep=meta['sep'], null=meta['null'],
+                          columns=meta['columns'])
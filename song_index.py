@@ -0,0 +1,67 @@
+import sys
+
+
+class SongIndex:
+    """
+    In-memory lookup from (title, artist_name) to (song_id, artist_id),
+    built from the rows of the song staging table as they are copied,
+    so the log transformers can resolve songplays without a join.
+
+    Keys and values are each stored as a single string, joined by a
+    NUL character, to keep the footprint small. If several songs have
+    the same title and artist, the first one is kept.
+
+    Attributes
+    ----------
+
+    columns: list, names of the columns of the song rows, which must
+    include title, artist_name, song_id and artist_id
+
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._positions = [self.columns.index(k)
+                           for k in ['title', 'artist_name', 'song_id', 'artist_id']]
+        self._index = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getstate__(self):
+        return self.columns, self._index
+
+    def __setstate__(self, state):
+        self.__init__(state[0])
+        self._index = state[1]
+
+    def add(self, title, artist_name, song_id, artist_id):
+        self._index.setdefault(title + '\0' + artist_name, song_id + '\0' + artist_id)
+
+    def get(self, title, artist_name):
+        """
+        Returns (song_id, artist_id) for a song, or None if not found.
+        """
+        value = self._index.get(title + '\0' + artist_name)
+        return tuple(value.split('\0')) if value is not None else None
+
+    def tap(self, chunk):
+        """
+        Adds the songs in a chunk of tab separated song rows, and returns
+        the chunk unchanged (for Stager.copy's tap argument).
+        """
+        i, j, k, m = self._positions
+        lines = chunk.split('\n')
+        if not lines[-1]:
+            lines.pop()  # after the last row's newline
+        for line in lines:
+            fields = line.split('\t')
+            if fields[i] and fields[j] and fields[k]:
+                self.add(fields[i], fields[j], fields[k], fields[m])
+        return chunk
+
+    def memory_footprint(self):
+        """
+        Returns the approximate size of the index in bytes.
+        """
+        return sys.getsizeof(self._index) + sum(
+            sys.getsizeof(k) + sys.getsizeof(v) for k, v in self._index.items())
@@ -0,0 +1,162 @@
+"""
+Opening the files yielded by staging.extract: plain paths, or members
+of a pack (see pack.py), which are read from a memory map of the pack.
+
+Newline-delimited JSON files can also be read as records of bytes
+straight from a memory map (see iter_records).
+
+Files compressed with gzip, bz2 or xz (.json.gz, .json.bz2, .json.xz)
+are decompressed as they are read, by whichever process transforms them.
+"""
+import bz2
+import collections
+import gzip
+import io
+import json
+import lzma
+import mmap
+import os
+
+
+# names of the files staged by extract
+JSON_SUFFIXES = ('.json', '.json.gz', '.json.bz2', '.json.xz')
+
+_openers = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+# a file stored in a pack: the bytes at [offset, offset + length) of pack_path
+PackMember = collections.namedtuple('PackMember', ['pack_path', 'path', 'offset', 'length'])
+
+# memory maps of the packs opened by this process, by path
+_maps = {}
+
+
+def is_pack(filepath):
+    return str(filepath).endswith('.pack')
+
+
+def index_path(pack_path):
+    return str(pack_path) + '.idx'
+
+
+def read_index(pack_path):
+    """
+    Returns a dict of path: entry for the files in a pack, where entries
+    are dicts with offset, length, size and mtime. If a path was added
+    more than once, the last entry is returned.
+    """
+    entries = {}
+    if os.path.exists(index_path(pack_path)):
+        with open(index_path(pack_path)) as f:
+            for line in f:
+                entry = json.loads(line)
+                entries[entry['path']] = entry
+    return entries
+
+
+def members(pack_path):
+    """
+    Yields a PackMember for each file in a pack, in the order they were added.
+    """
+    entries = sorted(read_index(pack_path).values(), key=lambda e: e['offset'])
+    for e in entries:
+        yield PackMember(str(pack_path), e['path'], e['offset'], e['length'])
+
+
+def _map(pack_path):
+    m = _maps.get(pack_path)
+    if m is None:
+        with open(pack_path, 'rb') as f:
+            m = _maps[pack_path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return m
+
+
+def read_member(member):
+    """
+    Returns the bytes of a file in a pack.
+    """
+    m = _map(member.pack_path)
+    if member.offset + member.length > len(m):
+        # the pack was appended to after it was mapped
+        m.close()
+        del _maps[member.pack_path]
+        m = _map(member.pack_path)
+    return m[member.offset:member.offset + member.length]
+
+
+def _opener(path):
+    """Returns the function to open path with, if it is compressed."""
+    return _openers.get(os.path.splitext(path)[1])
+
+
+def open_file(source, mode='rt'):
+    """
+    Opens a file yielded by extract, in text ('rt') or binary ('rb') mode,
+    decompressing it if it is compressed.
+    """
+    if isinstance(source, PackMember):
+        f = io.BytesIO(read_member(source))
+        return f if 'b' in mode else io.TextIOWrapper(f, encoding='utf-8')
+    opener = _opener(source)
+    if opener:
+        return opener(source, mode, encoding=None if 'b' in mode else 'utf-8')
+    return open(source, mode)
+
+
+def source_key(source):
+    """
+    Returns a string identifying a file yielded by extract.
+    """
+    if isinstance(source, PackMember):
+        return '{}#{}'.format(source.pack_path, source.offset)
+    return str(source)
+
+
+def size(source):
+    """
+    Returns the size in bytes of a file yielded by extract.
+    """
+    if isinstance(source, PackMember):
+        return source.length
+    return os.path.getsize(source)
+
+
+def _split_records(m, start, end):
+    pos = start
+    while pos < end:
+        nl = m.find(b'\n', pos, end)
+        if nl == -1:
+            nl = end
+        if nl > pos:
+            yield m[pos:nl]
+        pos = nl + 1
+
+
+def iter_records(source):
+    """
+    Yields the lines of a newline-delimited JSON file yielded by extract,
+    as bytes (which json.loads accepts), skipping empty lines.
+
+    The file is memory-mapped and each record is sliced out between
+    newline offsets, so there is one allocation per record and no
+    decoding to str, unlike iterating over a text file. Compressed files
+    are streamed through the decompressor line by line instead.
+    """
+    if isinstance(source, PackMember):
+        m = _map(source.pack_path)
+        if source.offset + source.length > len(m):
+            read_member(source)  # remaps the pack
+            m = _map(source.pack_path)
+        yield from _split_records(m, source.offset, source.offset + source.length)
+        return
+    if _opener(source):
+        with open_file(source, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield from _split_records(m, 0, len(m))
@@ -37,6 +37,139 @@ year INT,
 weekday BOOLEAN);
 """
 
+# distinct time rows and latest user rows collected from the log rows
+# (see dimensions.py)
+create_time_staging = """
+DROP TABLE IF EXISTS time_staging;
+CREATE UNLOGGED TABLE time_staging (
+start_time TIMESTAMP,
+hour INT,
+day INT,
+week INT,
+month INT,
+year INT,
+weekday BOOLEAN);
+"""
+
+create_user_staging = """
+DROP TABLE IF EXISTS user_staging;
+CREATE UNLOGGED TABLE user_staging (
+user_id INTEGER,
+first_name TEXT,
+last_name TEXT,
+gender TEXT,
+level TEXT);
+"""
+
+drop_dimension_staging = "DROP TABLE IF EXISTS time_staging, user_staging;"
+
+
+# MANIFEST OF LOADED FILES, FOR INCREMENTAL LOADS
+manifest_table_create = """
+CREATE TABLE IF NOT EXISTS {} (
+path varchar PRIMARY KEY,
+size bigint NOT NULL,
+mtime double precision NOT NULL,
+hash char(64) NOT NULL,
+loaded_at timestamp NOT NULL DEFAULT now());
+"""
+
+manifest_upsert = """
+INSERT INTO {} (path, size, mtime, hash) VALUES %s
+ON CONFLICT (path)
+DO UPDATE SET (size, mtime, hash, loaded_at) =
+(EXCLUDED.size, EXCLUDED.mtime, EXCLUDED.hash, now());
+"""
+
+
+# DEFINITIONS OF EXISTING TABLES, TO CHECK THE SCHEMA BEFORE REUSING IT
+schema_columns_select = """
+SELECT table_name, column_name, data_type, character_maximum_length,
+  numeric_precision, numeric_scale, is_nullable, column_default IS NOT NULL
+FROM information_schema.columns
+WHERE table_schema = %s AND table_name = ANY(%s)
+ORDER BY table_name, ordinal_position;
+"""
+
+schema_keys_select = """
+SELECT tc.table_name, tc.constraint_type, kcu.column_name
+FROM information_schema.table_constraints as tc
+JOIN information_schema.key_column_usage as kcu
+ON tc.constraint_schema = kcu.constraint_schema
+AND tc.constraint_name = kcu.constraint_name
+WHERE tc.table_schema = %s AND tc.table_name = ANY(%s)
+AND tc.constraint_type IN ('PRIMARY KEY', 'UNIQUE')
+ORDER BY tc.table_name, tc.constraint_type, kcu.ordinal_position;
+"""
+
+schema_kinds_select = """
+SELECT c.relname, c.relkind
+FROM pg_class as c
+JOIN pg_namespace as n
+ON n.oid = c.relnamespace
+WHERE n.nspname = %s AND c.relname = ANY(%s);
+"""
+
+# views (and other relations defined by rules) that read the given
+# tables, with their definitions
+dependent_views_select = """
+SELECT DISTINCT CAST(CAST(v.oid AS regclass) AS text), v.relkind, pg_get_viewdef(v.oid)
+FROM pg_depend as d
+JOIN pg_rewrite as r
+ON r.oid = d.objid
+JOIN pg_class as v
+ON v.oid = r.ev_class
+WHERE d.classid = CAST('pg_rewrite' AS regclass)
+AND d.refclassid = CAST('pg_class' AS regclass)
+AND d.refobjid = ANY(CAST(%s AS regclass[]))
+AND v.oid <> d.refobjid;
+"""
+
+
+# PROGRESS OF CHECKPOINTED STAGING LOADS
+# (files and bytes count the input files copied, whatever the copy format;
+# staging_progress_files holds the key of each file copied)
+progress_table_create = """
+CREATE TABLE IF NOT EXISTS staging_progress (
+table_name varchar PRIMARY KEY,
+last_file varchar NOT NULL,
+files bigint NOT NULL,
+bytes bigint NOT NULL,
+updated_at timestamp NOT NULL DEFAULT now());
+CREATE TABLE IF NOT EXISTS staging_progress_files (
+table_name varchar NOT NULL,
+file_key varchar NOT NULL,
+PRIMARY KEY (table_name, file_key));
+"""
+
+progress_select = """
+SELECT last_file, files, bytes FROM staging_progress WHERE table_name = %s;
+"""
+
+progress_upsert = """
+INSERT INTO staging_progress (table_name, last_file, files, bytes)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (table_name)
+DO UPDATE SET (last_file, files, bytes, updated_at) =
+(EXCLUDED.last_file, staging_progress.files + EXCLUDED.files,
+ staging_progress.bytes + EXCLUDED.bytes, now());
+"""
+
+progress_files_select = """
+SELECT file_key FROM staging_progress_files WHERE table_name = %s;
+"""
+
+progress_files_insert = """
+INSERT INTO staging_progress_files (table_name, file_key)
+SELECT %s, unnest(CAST(%s AS varchar[]))
+ON CONFLICT DO NOTHING;
+"""
+
+progress_delete = """
+DELETE FROM staging_progress WHERE table_name = %s;
+DELETE FROM staging_progress_files WHERE table_name = %s;
+"""
+
 
 # DROP TABLES
 songplay_table_drop = "DROP TABLE IF EXISTS songplays;"
@@ -44,6 +177,9 @@ user_table_drop = "DROP TABLE IF EXISTS users;"
 song_table_drop = "DROP TABLE IF EXISTS songs;"
 artist_table_drop = "DROP TABLE IF EXISTS artists;"
 time_table_drop = "DROP TABLE IF EXISTS time;"
+user_daily_drop = "DROP TABLE IF EXISTS user_daily_plays;"
+artist_weekly_drop = "DROP TABLE IF EXISTS artist_weekly_plays;"
+level_daily_drop = "DROP TABLE IF EXISTS level_daily_plays;"
 
 
 # CREATE TABLES
@@ -102,6 +238,90 @@ time_table_create = ("""
                          weekday boolean
                          );
                      """)
+# songplays and time as tables partitioned by month of start_time
+# (the primary key of songplays must include start_time); the partitions
+# are created for the months of each load (see partition_create)
+songplay_table_create_partitioned = ("""
+                         CREATE TABLE IF NOT EXISTS songplays (
+                             songplay_id serial,
+                             start_time timestamp NOT NULL,
+                             user_id integer NOT NULL,
+                             level char(4),
+                             song_id char(18) NOT NULL,
+                             artist_id char(18) NOT NULL,
+                             session_id integer,
+                             location varchar,
+                             user_agent varchar,
+                             PRIMARY KEY (songplay_id, start_time)
+                             ) PARTITION BY RANGE (start_time);
+                        """)
+
+time_table_create_partitioned = ("""
+                     CREATE TABLE IF NOT EXISTS time (
+                         start_time timestamp PRIMARY KEY,
+                         hour smallint,
+                         day smallint,
+                         week smallint,
+                         month smallint,
+                         year smallint,
+                         weekday boolean
+                         ) PARTITION BY RANGE (start_time);
+                     """)
+
+partition_create = """
+CREATE TABLE IF NOT EXISTS {} PARTITION OF {}
+FOR VALUES FROM (%s) TO (%s);
+"""
+
+partition_attach = "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);"
+
+partition_detach = "ALTER TABLE {} DETACH PARTITION {};"
+
+partitions_select = """
+SELECT c.relname
+FROM pg_inherits as i
+JOIN pg_class as c
+ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass(%s)
+ORDER BY c.relname;
+"""
+
+staged_months_select = """
+SELECT DISTINCT CAST(date_trunc('month', lstg.ts) AS date)
+FROM log_staging as lstg
+ORDER BY 1;
+"""
+
+# rollups of songplays for dashboards, refreshed for the days
+# (or weeks) touched by each load
+user_daily_create = ("""
+                     CREATE TABLE IF NOT EXISTS user_daily_plays (
+                         day date,
+                         user_id integer,
+                         plays integer NOT NULL,
+                         PRIMARY KEY (day, user_id)
+                         );
+                     """)
+
+artist_weekly_create = ("""
+                        CREATE TABLE IF NOT EXISTS artist_weekly_plays (
+                            week date,
+                            artist_id char(18),
+                            plays integer NOT NULL,
+                            PRIMARY KEY (week, artist_id)
+                            );
+                        """)
+
+level_daily_create = ("""
+                      CREATE TABLE IF NOT EXISTS level_daily_plays (
+                          day date,
+                          level char(4),
+                          plays integer NOT NULL,
+                          users integer NOT NULL,
+                          PRIMARY KEY (day, level)
+                          );
+                      """)
+
 
 # query to create foreign keys and indices for each fk
 set_fk1 = ("""
@@ -148,7 +368,7 @@ set_idx1 = "CREATE INDEX IF NOT EXISTS idx_start_time ON songplays (start_time);
 set_idx2 = "CREATE INDEX IF NOT EXISTS idx_user_id ON songplays (user_id);"
 set_idx3 = "CREATE INDEX IF NOT EXISTS idx_song_id ON songplays (song_id);"
 set_idx4 = "CREATE INDEX IF NOT EXISTS idx_artist_id ON songplays (artist_id);"
-set_idx5 = "CREATE INDEX IF NOT EXISTS idx_artist_id ON songs (artist_id);"
+set_idx5 = "CREATE INDEX IF NOT EXISTS idx_songs_artist_id ON songs (artist_id);"
 
 
 # INSERT RECORDS
@@ -164,6 +384,19 @@ ON l.song = s.title AND l.artist = s.artist_name
 ON CONFLICT DO NOTHING;
 """
 
+# songplays from a log_staging with song_id and artist_id resolved
+# during the transform (see song_index.py), without a join
+songplay_table_insert_resolved = """
+INSERT INTO songplays
+(start_time, user_id, level, song_id,
+  artist_id, session_id, location, user_agent)
+SELECT l.ts, CAST(l.userId AS INT), l.level, l.song_id, l.artist_id,
+  CAST(l.sessionId AS INTEGER), l.location, l.userAgent
+FROM log_staging as l
+WHERE l.song_id IS NOT NULL
+ON CONFLICT DO NOTHING;
+"""
+
 user_table_insert = """
 INSERT INTO users (user_id, first_name, last_name, gender, level)
 SELECT a, b, c, d, e FROM
@@ -200,15 +433,150 @@ FROM song_staging as sstg
 ON CONFLICT DO NOTHING;
 """
 
+# users and time from the rows deduplicated during the transform
+# (see dimensions.py), without a window over all events
+user_table_insert_dedup = """
+INSERT INTO users (user_id, first_name, last_name, gender, level)
+SELECT ustg.user_id, ustg.first_name, ustg.last_name, ustg.gender, ustg.level
+FROM user_staging as ustg
+ON CONFLICT (user_id)
+DO UPDATE SET (first_name, last_name, gender, level) =
+(EXCLUDED.first_name, EXCLUDED.last_name, EXCLUDED.gender, EXCLUDED.level);
+"""
+
+time_table_insert_dedup = """
+INSERT INTO time (start_time, hour, day, week, month, year, weekday)
+SELECT tstg.start_time, tstg.hour, tstg.day, tstg.week,
+  tstg.month, tstg.year, tstg.weekday
+FROM time_staging as tstg
+ON CONFLICT DO NOTHING;
+"""
+
+
+# REFRESH ROLLUPS
+# each rollup is recomputed from songplays for the days (weeks start
+# on Monday) of the events in log_staging, in one transaction
+touched_days_create = """
+CREATE TEMP TABLE touched_days ON COMMIT DROP AS
+SELECT DISTINCT CAST(lstg.ts AS date) AS day
+FROM log_staging as lstg;
+"""
+
+user_daily_delete = """
+DELETE FROM user_daily_plays
+WHERE day IN (SELECT day FROM touched_days);
+"""
+
+user_daily_insert = """
+INSERT INTO user_daily_plays (day, user_id, plays)
+SELECT d.day, sp.user_id, COUNT(*)
+FROM touched_days as d
+JOIN songplays as sp
+ON sp.start_time >= d.day AND sp.start_time < d.day + 1
+GROUP BY d.day, sp.user_id;
+"""
+
+artist_weekly_delete = """
+DELETE FROM artist_weekly_plays
+WHERE week IN (SELECT CAST(date_trunc('week', day) AS date) FROM touched_days);
+"""
+
+artist_weekly_insert = """
+INSERT INTO artist_weekly_plays (week, artist_id, plays)
+SELECT w.week, sp.artist_id, COUNT(*)
+FROM (SELECT DISTINCT CAST(date_trunc('week', day) AS date) AS week
+      FROM touched_days) as w
+JOIN songplays as sp
+ON sp.start_time >= w.week AND sp.start_time < w.week + 7
+GROUP BY w.week, sp.artist_id;
+"""
+
+level_daily_delete = """
+DELETE FROM level_daily_plays
+WHERE day IN (SELECT day FROM touched_days);
+"""
+
+level_daily_insert = """
+INSERT INTO level_daily_plays (day, level, plays, users)
+SELECT d.day, sp.level, COUNT(*), COUNT(DISTINCT sp.user_id)
+FROM touched_days as d
+JOIN songplays as sp
+ON sp.start_time >= d.day AND sp.start_time < d.day + 1
+GROUP BY d.day, sp.level;
+"""
+
+
+# UPSERT RECORDS, FOR INCREMENTAL LOADS
+# songplays are resolved against the songs and artists tables, since
+# song_staging only holds the new song files, and events that are
+# already in songplays (from an earlier version of a file) are skipped
+songplay_table_upsert = """
+INSERT INTO songplays
+(start_time, user_id, level, song_id,
+  artist_id, session_id, location, user_agent)
+SELECT l.ts, CAST(l.userId AS INT), l.level, s.song_id, s.artist_id,
+  CAST(l.sessionId AS INTEGER), l.location, l.userAgent
+FROM log_staging as l
+JOIN songs as s
+ON l.song = s.title
+JOIN artists as a
+ON s.artist_id = a.artist_id AND l.artist = a.name
+WHERE NOT EXISTS (
+  SELECT 1 FROM songplays as sp
+  WHERE sp.start_time = l.ts
+  AND sp.user_id = CAST(l.userId AS INT)
+  AND sp.session_id = CAST(l.sessionId AS INTEGER));
+"""
+
+song_table_upsert = """
+INSERT INTO songs (song_id, title, artist_id, year, duration)
+SELECT DISTINCT ON (sstg.song_id)
+  sstg.song_id, sstg.title, sstg.artist_id, sstg.year, sstg.duration
+FROM song_staging as sstg
+ORDER BY sstg.song_id, sstg.id DESC
+ON CONFLICT (song_id)
+DO UPDATE SET (title, artist_id, year, duration) =
+(EXCLUDED.title, EXCLUDED.artist_id, EXCLUDED.year, EXCLUDED.duration);
+"""
+
+artist_table_upsert = """
+INSERT INTO artists (artist_id, name, location, latitude, longitude)
+SELECT DISTINCT ON (sstg.artist_id)
+  sstg.artist_id, sstg.artist_name, sstg.artist_location,
+  sstg.artist_latitude, sstg.artist_longitude
+FROM song_staging as sstg
+ORDER BY sstg.artist_id, sstg.id DESC
+ON CONFLICT (artist_id)
+DO UPDATE SET (name, location, latitude, longitude) =
+(EXCLUDED.name, EXCLUDED.location, EXCLUDED.latitude, EXCLUDED.longitude);
+"""
+
 
 # QUERY LISTS
 create_table_queries = [songplay_table_create, user_table_create,
                         song_table_create, artist_table_create,
-                        time_table_create]
+                        time_table_create, user_daily_create,
+                        artist_weekly_create, level_daily_create]
 drop_table_queries = [songplay_table_drop, user_table_drop,
                       song_table_drop, artist_table_drop,
-                      time_table_drop]
+                      time_table_drop, user_daily_drop,
+                      artist_weekly_drop, level_daily_drop]
 insert_queries = [artist_table_insert, song_table_insert,
                   user_table_insert, time_table_insert, songplay_table_insert]
+resolved_insert_queries = [artist_table_insert, song_table_insert,
+                           user_table_insert, time_table_insert,
+                           songplay_table_insert_resolved]
+upsert_queries = [artist_table_upsert, song_table_upsert,
+                  user_table_insert, time_table_insert, songplay_table_upsert]
+# replacements of the queries above when dimensions are deduplicated
+dedup_queries = {user_table_insert: user_table_insert_dedup,
+                 time_table_insert: time_table_insert_dedup}
+rollup_refresh_queries = [touched_days_create,
+                          user_daily_delete, user_daily_insert,
+                          artist_weekly_delete, artist_weekly_insert,
+                          level_daily_delete, level_daily_insert]
+# replacements of create_table_queries for tables partitioned by month
+partitioned_create_queries = {'songplays': songplay_table_create_partitioned,
+                              'time': time_table_create_partitioned}
 fk_queries = [set_fk1, set_fk2, set_fk3, set_fk4, set_fk5]
 idx_queries = [set_idx1, set_idx2, set_idx3, set_idx4, set_idx5]
@@ -1,21 +1,305 @@
+import collections
+import heapq
 import io
+import json
 import os
 import glob
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
 import psycopg2
 from psycopg2 import sql
 import pandas as pd
 import sql_queries
-from string_iterator import StringIteratorIO
+import pgcopy
+from db import ConnectionGroup
+import sources
+from sources import is_pack, members
+from string_iterator import StringIteratorIO, BytesIteratorIO
 
 
-def extract(filepath):
+# a file found by `discover`, with its size in bytes and mtime
+FileInfo = collections.namedtuple('FileInfo', ['path', 'size', 'mtime'])
+
+
+def _scan(dirpath, suffixes):
+    """Lists a directory: returns its subdirectories and matching files."""
+    dirs = []
+    files = []
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            # like os.walk, don't descend into symlinked directories (which may loop)
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif entry.name.endswith(suffixes) and entry.is_file():
+                st = entry.stat()
+                files.append((entry.name, st.st_size, st.st_mtime))
+    return dirs, files
+
+
+def discover(filepath, suffixes=('.json',), cache_path=None):
+    """
+    Returns a FileInfo for each file under filepath whose name ends with
+    one of suffixes, sorted by path. Each directory is listed once with
+    os.scandir, which also gives the size and mtime of its files.
+
+    If cache_path is given, the listing of each directory is saved there
+    (as JSON), and on later calls a directory is only listed again if its
+    mtime changed, i.e. if files were added, removed or renamed in it.
+    The sizes and mtimes of files in directories that did not change are
+    the cached ones, so files rewritten in place are not noticed.
+    """
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+    new_cache = {}
+
+    result = []
+    stack = [str(filepath)]
+    while stack:
+        dirpath = stack.pop()
+        mtime = os.stat(dirpath).st_mtime
+        cached = cache.get(dirpath)
+        if cached and cached['mtime'] == mtime and cached['suffixes'] == list(suffixes):
+            dirs, files = cached['dirs'], cached['files']
+        else:
+            dirs, files = _scan(dirpath, suffixes)
+        new_cache[dirpath] = {'mtime': mtime, 'suffixes': list(suffixes),
+                              'dirs': dirs, 'files': files}
+        result.extend(FileInfo(os.path.join(dirpath, name), size, mtime)
+                      for name, size, mtime in files)
+        stack.extend(os.path.join(dirpath, d) for d in dirs)
+
+    if cache_path:
+        with open(cache_path, 'w') as f:
+            json.dump(new_cache, f)
+    result.sort()
+    return result
+
+
+def _size(f):
+    return f.size if isinstance(f, FileInfo) else sources.size(f)
+
+
+def shard(files, n):
+    """
+    Splits files (FileInfo tuples, or anything yielded by extract) into
+    n lists of about equal total size, by giving the largest remaining
+    file to the list with the smallest total so far. Each list is
+    sorted in the order of files.
+
+    The sizes of FileInfo tuples are the discovered ones; other files
+    are sized (with sources.size) once each.
+    """
+    order = {f: i for i, f in enumerate(files)}
+    sizes = {f: _size(f) for f in files}
+    heap = [(0, i) for i in range(n)]
+    shards = [[] for _ in range(n)]
+    for f in sorted(files, key=sizes.__getitem__, reverse=True):
+        total, i = heapq.heappop(heap)
+        shards[i].append(f)
+        heapq.heappush(heap, (total + sizes[f], i))
+    return [sorted(s, key=order.__getitem__) for s in shards]
+
+
+def extract(filepath, cache_path=None, info=False):
+    """
+    Yields all .json files from filepath, sorted by path, including
+    compressed ones (see sources.JSON_SUFFIXES).
+
+    If filepath is a pack (see pack.py), yields its members instead,
+    which are opened with sources.open_file.
+
+    cache_path is passed to `discover`, to reuse the directory listings
+    of earlier calls. If info=True, the FileInfo of each file is yielded
+    instead of its path (pack members are yielded as they are).
+    """
+    if is_pack(filepath):
+        yield from members(filepath)
+        return
+    for file_info in discover(filepath, sources.JSON_SUFFIXES, cache_path):
+        yield file_info if info else file_info.path
+
+
+def iter_text(result):
+    """
+    Yields the text of a transformer's result, which may be a single
+    string or an iterable of strings (rows or chunks).
+    Bytes are treated like strings.
+    """
+    if isinstance(result, (str, bytes)):
+        yield result
+    else:
+        yield from result
+
+
+# transformer used by each worker process of `parallel_transform`
+_worker_transformer = None
+
+
+def _init_worker(transformer):
+    global _worker_transformer
+    _worker_transformer = transformer
+
+
+def _transform_chunk(files):
+    parts = [text for f in files for text in iter_text(_worker_transformer(f))]
+    empty = b'' if parts and isinstance(parts[0], bytes) else ''
+    return empty.join(parts)
+
+
+# default limit of the input bytes of a chunk of `parallel_transform`
+CHUNK_BYTES = 1 << 26
+
+
+def _chunks(files, chunksize, chunk_bytes):
+    """
+    Yields lists of at most chunksize files, and (if chunk_bytes is
+    not None) of at most chunk_bytes bytes, unless a single file is larger.
+    """
+    if chunk_bytes is None:
+        while (chunk := list(islice(files, chunksize))):
+            yield chunk
+        return
+    chunk = []
+    total = 0
+    for f in files:
+        size = _size(f)
+        if chunk and (len(chunk) >= chunksize or total + size > chunk_bytes):
+            yield chunk
+            chunk = []
+            total = 0
+        chunk.append(f)
+        total += size
+    if chunk:
+        yield chunk
+
+
+def parallel_transform(transformer, files, workers, chunksize=16, depth=None,
+                       chunk_bytes=CHUNK_BYTES):
+    """
+    Yields the transformed text of files, computed by a pool of
+    worker processes.
+
+    Files are sent to the pool in lists of at most `chunksize` files and
+    `chunk_bytes` bytes of input (a larger file is a list of its own;
+    chunk_bytes=None only limits the number of files), and at most
+    `depth` lists (default 2 * workers) are in flight at once, so memory
+    stays bounded even if the consumer is slower than the pool.
+    Results are yielded in the order of `files`, one string per chunk.
+
+    The transformer must be picklable, i.e. a module level function.
     """
-    Yields all .json files from filepath.
+    depth = depth or 2 * workers
+    chunks = _chunks(iter(files), chunksize, chunk_bytes)
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(transformer,)) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < depth:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(pool.submit(_transform_chunk, chunk))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+
+class Pipeline:
     """
-    for root, _, _ in os.walk(filepath):
-        files = glob.glob(os.path.join(root, '*.json'))
-        for f in files:
-            yield f
+    Iterates over an iterable in a producer thread, passing its items to
+    the consumer through a queue of at most depth items, so producing
+    (e.g. transforming files) overlaps with consuming (e.g. COPY).
+
+    Iterating over a Pipeline yields the items of the iterable; errors
+    in the producer are raised in the consumer. If the consumer stops
+    early, close() stops the producer.
+
+    stats() reports where time was lost: put_wait_s is the time the
+    producer waited on a full queue (the consumer is the bottleneck,
+    e.g. the database), get_wait_s the time the consumer waited on an
+    empty queue (the producer is the bottleneck, e.g. the CPU), and
+    mean_occupancy the mean queue length seen by the consumer.
+    """
+    _done = object()
+
+    def __init__(self, iterable, depth=16):
+        self.iterable = iterable
+        self.depth = depth
+        self.items = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        self._occupancy = 0
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.put_wait += time.perf_counter() - start
+
+    def _produce(self):
+        try:
+            for item in self.iterable:
+                if self._stop.is_set():
+                    break
+                self._put(item)
+            else:
+                self._put(self._done)
+        except BaseException as e:
+            self._put(e)
+        finally:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def __iter__(self):
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                self._occupancy += self._queue.qsize()
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    start = time.perf_counter()
+                    item = self._queue.get()
+                    self.get_wait += time.perf_counter() - start
+                if item is self._done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                self.items += 1
+                yield item
+        finally:
+            self.close()
+
+    def stats(self):
+        return {'depth': self.depth,
+                'items': self.items,
+                'put_wait_s': self.put_wait,
+                'get_wait_s': self.get_wait,
+                'mean_occupancy': self._occupancy / max(1, self.items)}
 
 
 class Stager:
@@ -44,11 +328,26 @@ class Stager:
     columns: dict or list, names of columns in staging table, with data types
     as values, if passed a dictionary.
 
-    transformer: function, takes a filepath to a .json file and returns
-    a CSV string with \t separator and null values as a null string.
+    transformer: function, takes a file yielded by `extract` (a path to
+    a .json file, or a member of a pack, opened with sources.open_file)
+    and returns
+    a CSV string with \t separator and null values as a null string,
+    or an iterable of such strings (e.g. a generator yielding one row
+    at a time), so large files can be streamed.
+
+    row_transformer: function (optional), takes a filepath to a .json file
+    and yields rows as tuples of Python values, in the order of columns.
+    Used to copy in binary format (see pgcopy.py), which requires columns
+    to be a dict of supported data types.
+
+    listing_cache: string (optional), path of the file `discover` caches
+    the directory listings of filepath in, so directories that did not
+    change are not listed again on the next run. Files rewritten in place
+    in such directories keep their cached size and mtime.
 
     """
-    def __init__(self, filepath, table_name, columns, transformer):
+    def __init__(self, filepath, table_name, columns, transformer,
+                 row_transformer=None, listing_cache=None):
         self.filepath = filepath
         self.table_name = table_name
         if isinstance(columns, dict):
@@ -58,6 +357,9 @@ class Stager:
         else:
             raise TypeError('columns must be a dict or list')
         self.transformer = transformer
+        self.row_transformer = row_transformer
+        self.listing_cache = listing_cache
+        self.pipeline_stats = None
 
     def get_table_name(self):
         return self.table_name
@@ -74,25 +376,220 @@ class Stager:
         else:
             return self.columns.keys()
 
-    def copy(self, cur, stream=True):
-        if stream:
-            gen = (self.transformer(file) for file in extract(self.filepath))
+    def transform(self, workers=None, chunksize=16, files=None, binary=False):
+        """
+        Yields the transformed text of each file in filepath,
+        as the strings produced by the transformer.
+
+        If binary=True, yields the rows of the row transformer in
+        PGCOPY format instead (without the header and trailer).
+
+        If files is given, only those files are transformed.
+
+        If workers is given, files are transformed by a pool of that
+        many processes (see `parallel_transform`).
+        """
+        if files is None:
+            files = extract(self.filepath, self.listing_cache)
+        transformer = self.transformer
+        if binary:
+            if self.row_transformer is None:
+                raise ValueError('binary copy requires a row_transformer')
+            transformer = pgcopy.RowEncoder(self.row_transformer, self.columns.values())
+        if workers:
+            return parallel_transform(transformer, files, workers, chunksize)
+        return (text for file in files for text in iter_text(transformer(file)))
+
+    def copy(self, cur, stream=True, workers=None, chunksize=16, files=None,
+             binary=False, tap=None, pipeline_depth=None):
+        """
+        Copies the transformed files to the staging table.
+
+        cur is a psycopg2 cursor, or any other sink with its copy_from
+        and copy_expert methods (see sinks.py).
+
+        If binary=True, the rows of the row transformer are copied in
+        PostgreSQL's binary format, instead of the transformer's text.
+
+        If files is given, only those files are copied, instead of
+        every .json file in filepath.
+
+        If stream=True, the transformed files are fed to COPY as they
+        are produced; otherwise they are written to a buffer first.
+
+        If workers is given, the transformer runs in a pool of that
+        many processes, with chunksize files sent to a worker at a time.
+
+        If tap is given, it is called in this process with each chunk of
+        transformed text (or bytes, if binary), and the chunk it returns
+        is copied instead, e.g. to collect data from the rows as they
+        go by (see song_index.py).
+
+        If pipeline_depth is given, the transform runs in its own thread,
+        feeding COPY through a queue of that many chunks (see Pipeline),
+        and the statistics of the queue are stored in pipeline_stats.
+
+        Returns the number of characters (or bytes, if binary) copied.
+        """
+        gen = self.transform(workers, chunksize, files, binary)
+        if tap:
+            gen = map(tap, gen)
+        if pipeline_depth:
+            pipeline = gen = Pipeline(gen, pipeline_depth)
+            try:
+                return self._copy(cur, gen, stream, binary)
+            finally:
+                pipeline.close()
+                self.pipeline_stats = pipeline.stats()
+        return self._copy(cur, gen, stream, binary)
+
+    def _copy(self, cur, gen, stream, binary):
+        if binary:
+            query = 'COPY {} ({}) FROM STDIN WITH (FORMAT binary);'.format(
+                self.table_name, ', '.join(self.get_columns()))
+            gen = chain([pgcopy.HEADER], gen, [pgcopy.TRAILER])
+            if stream:
+                with BytesIteratorIO(gen) as f:
+                    cur.copy_expert(query, f)
+                    return f.consumed
+            else:
+                with io.BytesIO() as f:
+                    for data in gen:
+                        f.write(data)
+                    f.seek(0)
+                    cur.copy_expert(query, f)
+                    return f.tell()
+        elif stream:
             with StringIteratorIO(gen) as f:
                 cur.copy_from(f, self.table_name, columns=tuple(self.get_columns()), null='')
+                return f.consumed
         else:
             with io.StringIO() as f:
-                for file in extract(self.filepath):
-                    f.write(self.transformer(file))
+                for text in gen:
+                    f.write(text)
                 f.seek(0)
                 cur.copy_from(f, self.table_name, columns=tuple(self.get_columns()), null='')
+                return f.tell()
 
-    
+    def copy_sharded(self, connect, shards, stream=True, workers=None,
+                     files=None, two_phase=False, binary=False, tap=None):
+        """
+        Copies the transformed files to the staging table over several
+        connections at once.
+
+        The files are split into `shards` lists of about equal total size
+        (see `shard`), and each list is copied
+        by its own COPY on its own connection, from a separate thread.
+        files may be FileInfo tuples, whose sizes are used to shard them;
+        by default, those of the discovered files are.
+        The connections are committed together once every COPY has
+        finished, or all rolled back if any fails (see ConnectionGroup).
+        The tap, if given, is called from each of the threads.
+
+        connect: function returning a new psycopg2 connection.
 
-    def create_table(self, cur):
+        Returns the number of characters (or bytes, if binary) copied.
+        """
+        if files is None:
+            files = list(extract(self.filepath, self.listing_cache, info=True))
+        groups = [[f.path if isinstance(f, FileInfo) else f for f in group]
+                  for group in shard(files, shards)]
+        with ConnectionGroup(connect, shards, two_phase) as conns:
+            with ThreadPoolExecutor(shards) as pool:
+                futures = [pool.submit(self.copy, conn.cursor(), stream, workers,
+                                       files=group, binary=binary, tap=tap)
+                           for conn, group in zip(conns, groups)]
+                return sum(future.result() for future in futures)
+
+    def copy_checkpointed(self, conn, batch_files=1000, batch_bytes=None,
+                          files=None, **kwargs):
+        """
+        Copies the transformed files to the staging table in batches of
+        at most batch_files files (or batch_bytes bytes of input, if given),
+        committing each batch together with the keys of the files it
+        copied (in staging_progress_files) and the last of them, in the
+        staging_progress table, which also counts the files and the bytes
+        of input (as batch_bytes does) copied so far.
+
+        If an earlier run failed, exactly the files it committed are
+        skipped, so files added since then are copied wherever they sort.
+        The progress is kept until clear_progress() is called, once the
+        staged data has been used.
+
+        conn: psycopg2 connection. Other keyword arguments are passed to copy.
+        Returns the number of characters (or bytes, if binary) copied by this call.
+        """
+        cur = conn.cursor()
+        cur.execute(sql_queries.progress_table_create)
+        cur.execute(sql_queries.progress_select, (self.table_name,))
+        progress = cur.fetchone()
+        cur.execute(sql_queries.progress_files_select, (self.table_name,))
+        done = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+        if files is None:
+            files = list(extract(self.filepath, self.listing_cache))
+        if progress:
+            keys = [sources.source_key(f) for f in files]
+            missing = done.difference(keys)
+            if missing:
+                raise ValueError('copied files of {} are no longer staged: {}; '
+                                 'clear the progress to start again'.format(
+                                     self.table_name, ', '.join(sorted(missing))))
+            files = [f for f, key in zip(files, keys) if key not in done]
+            print('* Resuming {} after {} files'.format(self.table_name, progress[1]))
+
+        copied = 0
+        batch = []
+        batch_size = 0
+        for i, f in enumerate(files):
+            batch.append(f)
+            batch_size += sources.size(f)
+            if (len(batch) >= batch_files or (batch_bytes and batch_size >= batch_bytes)
+                    or i == len(files) - 1):
+                n = self.copy(cur, files=batch, **kwargs)
+                cur.execute(sql_queries.progress_files_insert,
+                            (self.table_name, [sources.source_key(f) for f in batch]))
+                cur.execute(sql_queries.progress_upsert,
+                            (self.table_name, sources.source_key(batch[-1]), len(batch),
+                             batch_size))
+                conn.commit()
+                copied += n
+                batch = []
+                batch_size = 0
+        cur.close()
+        return copied
+
+    def clear_progress(self, cur):
+        """
+        Deletes the progress of copy_checkpointed, so the next call starts again.
+        """
+        cur.execute(sql_queries.progress_table_create)
+        cur.execute(sql_queries.progress_delete, (self.table_name, self.table_name))
+
+    def has_progress(self, cur):
+        """
+        Returns True if copy_checkpointed has committed batches that were
+        not cleared, i.e. a checkpointed copy can be resumed.
+        """
+        cur.execute("SELECT to_regclass('staging_progress');")
+        if cur.fetchone()[0] is None:
+            return False
+        cur.execute(sql_queries.progress_select, (self.table_name,))
+        return cur.fetchone() is not None
+
+    def create_table(self, cur, if_not_exists=False, logged=False):
+        """
+        Creates the staging table, unlogged unless logged=True. Unlogged
+        tables are emptied by crash recovery, so copy_checkpointed needs
+        a logged table for its committed batches to outlive a crash.
+        """
         cols_str = ', '.join([k + ' ' + v for k, v in self.columns.items()])
-        query = 'CREATE UNLOGGED TABLE {} (id SERIAL, {});'.format(self.table_name, cols_str)
+        query = 'CREATE {}TABLE {}{} (id SERIAL, {});'.format(
+            '' if logged else 'UNLOGGED ', 'IF NOT EXISTS ' if if_not_exists else '',
+            self.table_name, cols_str)
         cur.execute(query)
 
-    def drop_table(self, cur):
-        query = 'DROP TABLE {};'.format(self.table_name)
+    def drop_table(self, cur, if_exists=False):
+        query = 'DROP TABLE {}{};'.format('IF EXISTS ' if if_exists else '', self.table_name)
         cur.execute(query)
@@ -1,30 +1,119 @@
 import io
+from collections import deque
 
 
-def sub_read(fragment, iter, n):
-    """fragment is a string of length < n """
-    try:
-        next_ = next(iter)
-    except StopIteration:
-        return fragment, ''
-    else:
-        result = fragment + next_
-        if len(result) >= n:
-            return result[:n], result[n:]
-        else:
-            return sub_read(result, iter, n)
+class ChunkBuffer:
+    """
+    Buffer of str or bytes chunks pulled from an iterator on demand.
+
+    Chunks are kept in a deque with an offset into the first chunk,
+    so each character is copied at most once when read, and reads
+    run in time linear in the amount of data returned.
+    """
+    def __init__(self, iterator, empty=''):
+        self._iterator = iter(iterator)
+        self._chunks = deque()
+        self._offset = 0  # start of unread data in self._chunks[0]
+        self._size = 0    # length of unread data in the buffer
+        self.consumed = 0  # length of data read so far
+        self._empty = empty
+        self._newline = '\n' if isinstance(empty, str) else b'\n'
+
+    def _pull(self):
+        """
+        Appends the next non-empty chunk to the buffer.
+        Returns False if the iterator is exhausted.
+        """
+        for chunk in self._iterator:
+            if chunk:
+                if not isinstance(chunk, type(self._empty)):
+                    chunk = chunk.encode()
+                self._chunks.append(chunk)
+                self._size += len(chunk)
+                return True
+        return False
+
+    def _fill(self, size):
+        """Buffers chunks until size items are unread, or the iterator is exhausted."""
+        while (size < 0 or self._size < size) and self._pull():
+            pass
+
+    def _take(self, size):
+        """Removes and returns at most size buffered items."""
+        parts = []
+        remaining = min(size, self._size)
+        self._size -= remaining
+        self.consumed += remaining
+        while remaining:
+            head = self._chunks[0]
+            end = min(len(head), self._offset + remaining)
+            parts.append(head[self._offset:end])
+            remaining -= end - self._offset
+            if end == len(head):
+                self._chunks.popleft()
+                self._offset = 0
+            else:
+                self._offset = end
+        return self._empty.join(parts)
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        self._fill(size)
+        return self._take(self._size if size < 0 else size)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        scanned = 0  # unread items checked for a newline so far
+        i = 0        # index of the next chunk to scan
+        while size < 0 or scanned < size:
+            if i == len(self._chunks) and not self._pull():
+                break
+            chunk = self._chunks[i]
+            start = self._offset if i == 0 else 0
+            pos = chunk.find(self._newline, start)
+            if pos > -1:
+                scanned += pos + 1 - start
+                break
+            scanned += len(chunk) - start
+            i += 1
+        if size > -1:
+            scanned = min(scanned, size)
+        return self._take(scanned)
 
+    def readinto(self, b):
+        """
+        Copies at most len(b) items into the writable buffer b,
+        straight from the buffered chunks. Returns the number copied.
+        """
+        view = memoryview(b).cast('B')
+        self._fill(len(view))
+        n = 0
+        while n < len(view) and self._chunks:
+            head = self._chunks[0]
+            end = min(len(head), self._offset + len(view) - n)
+            view[n:n + end - self._offset] = memoryview(head)[self._offset:end]
+            n += end - self._offset
+            if end == len(head):
+                self._chunks.popleft()
+                self._offset = 0
+            else:
+                self._offset = end
+        self._size -= n
+        self.consumed += n
+        return n
 
 
 class StringIteratorIO(io.TextIOBase):
     """
-    File-like object fed by iterator.
+    File-like object fed by an iterator of strings.
 
-    Needs to implement read() and readline().
+    Implements read() and readline(), so it can be passed to
+    cursor.copy_from() and cursor.copy_expert().
     """
     def __init__(self, iterator):
-        self._iterator = iterator
-        self.tail = ''
+        self._buffer = ChunkBuffer(iterator, '')
 
     def readable(self):
         return True
@@ -34,35 +123,21 @@ class StringIteratorIO(io.TextIOBase):
 
     def writable(self):
         return False
-                
+
+    @property
+    def consumed(self):
+        """Number of characters read so far."""
+        return self._buffer.consumed
+
     def read(self, size=-1):
         """
         Read and return at most size characters from the stream as a single str.
         If size is negative or None, reads until EOF.
         """
-        if size > -1:
-            if len(self.tail) >= size:
-                result = self.tail[:size]
-                self.tail = self.tail[size:]
-                return result
-            else:
-                result, self.tail = sub_read(self.tail, self._iterator, size)
-                return result
-        elif size < 0 or size is None:
-            result = self.tail
-            while not (EOF := False):
-                try:
-                    next_ = next(self._iterator)
-                except StopIteration:
-                    self.tail = ''
-                    return result
-                else:
-                    result += next_
-            self.tail = ''
-            return result
-        else:
+        if size is not None and not isinstance(size, int):
             raise ValueError("size must be an integer or None")
-                
+        return self._buffer.read(size)
+
     def readline(self, size=-1):
         """
         Read until newline or EOF and return a single str. If the stream
@@ -70,4 +145,52 @@ class StringIteratorIO(io.TextIOBase):
 
         If size is specified, at most size characters will be read.
         """
-        raise NotImplementedError
+        if size is not None and not isinstance(size, int):
+            raise ValueError("size must be an integer or None")
+        return self._buffer.readline(size)
+
+
+class BytesIteratorIO(io.RawIOBase):
+    """
+    Binary file-like object fed by an iterator of bytes (or strings,
+    which are encoded as UTF-8).
+
+    Implements readinto(), which copies data from the iterator's
+    chunks directly into the caller's buffer.
+    """
+    def __init__(self, iterator):
+        self._buffer = ChunkBuffer(iterator, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def writable(self):
+        return False
+
+    @property
+    def consumed(self):
+        """Number of bytes read so far."""
+        return self._buffer.consumed
+
+    def readinto(self, b):
+        return self._buffer.readinto(b)
+
+    def read(self, size=-1):
+        """
+        Read and return at most size bytes from the stream.
+        If size is negative or None, reads until EOF.
+        """
+        return self._buffer.read(size)
+
+    def readall(self):
+        return self._buffer.read(-1)
+
+    def readline(self, size=-1):
+        """
+        Read until newline or EOF and return a single bytes object.
+        If size is specified, at most size bytes will be read.
+        """
+        return self._buffer.readline(size)
@@ -0,0 +1,114 @@
+from unittest import TestCase, main
+import datetime
+from create_tables import table_names, schema_diff, drop_post_load, swap_shadow
+from create_tables import table_queries, month_bounds, partition_name, create_partitions
+
+
+class RecordingCursor:
+    """Records the queries executed, and returns results in turn from fetchall."""
+    def __init__(self, results=()):
+        self.queries = []
+        self.args = []
+        self.results = list(results)
+
+    def execute(self, query, args=None):
+        self.queries.append(query)
+        self.args.append(args)
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+    def commit(self):
+        self.queries.append('COMMIT')
+
+    def rollback(self):
+        self.queries.append('ROLLBACK')
+
+
+class SchemaTestCase(TestCase):
+    def test_table_names(self):
+        self.assertEqual(['songplays', 'users', 'songs', 'artists', 'time', 'user_daily_plays',
+                          'artist_weekly_plays', 'level_daily_plays'], table_names)
+
+    def test_schema_diff(self):
+        expected = {t: ([('id', 'integer', None, 32, 0, 'NO', True)],
+                        [('PRIMARY KEY', 'id')])
+                    for t in table_names}
+        actual = dict(expected)
+        actual['users'] = ([('id', 'bigint', None, 64, 0, 'NO', True)], [('PRIMARY KEY', 'id')])
+        del actual['time']
+        self.assertEqual((['songplays', 'songs', 'artists', 'user_daily_plays',
+                           'artist_weekly_plays', 'level_daily_plays'], ['users'], ['time']),
+                         schema_diff(expected, actual))
+
+    def test_drop_post_load(self):
+        cur = RecordingCursor()
+        drop_post_load(cur)
+        self.assertIn('ALTER TABLE IF EXISTS songplays DROP CONSTRAINT IF EXISTS fk__songplays__time;',
+                      cur.queries)
+        self.assertIn('DROP INDEX IF EXISTS idx_songs_artist_id;', cur.queries)
+        self.assertEqual(10, len(cur.queries))
+
+    def test_swap_shadow(self):
+        # live tables, views on them, then partitions of public.songplays
+        # and shadow.songplays
+        cur = RecordingCursor([[('songplays',), ('users',)],
+                               [('plays_per_user', 'v', ' SELECT user_id FROM songplays;')],
+                               [('songplays_2018_10',)], [('songplays_2018_11',)]])
+        swap_shadow(cur, cur)
+        queries = [q for q in cur.queries if 'SELECT' not in q or 'VIEW' in q]
+        self.assertEqual(['SET LOCAL search_path TO public;',
+                          'DROP SCHEMA IF EXISTS retired CASCADE;',
+                          'CREATE SCHEMA retired;',
+                          'LOCK TABLE public.songplays, public.users IN ACCESS EXCLUSIVE MODE;',
+                          'ALTER TABLE public.songplays SET SCHEMA retired;',
+                          'ALTER TABLE public.songplays_2018_10 SET SCHEMA retired;',
+                          'ALTER TABLE shadow.songplays SET SCHEMA public;',
+                          'ALTER TABLE shadow.songplays_2018_11 SET SCHEMA public;',
+                          'ALTER TABLE public.users SET SCHEMA retired;',
+                          'ALTER TABLE shadow.users SET SCHEMA public;',
+                          'ALTER TABLE shadow.songs SET SCHEMA public;',
+                          'ALTER TABLE shadow.artists SET SCHEMA public;',
+                          'ALTER TABLE shadow.time SET SCHEMA public;',
+                          'ALTER TABLE shadow.user_daily_plays SET SCHEMA public;',
+                          'ALTER TABLE shadow.artist_weekly_plays SET SCHEMA public;',
+                          'ALTER TABLE shadow.level_daily_plays SET SCHEMA public;',
+                          'CREATE OR REPLACE VIEW plays_per_user AS  SELECT user_id FROM songplays;',
+                          'COMMIT',
+                          'DROP SCHEMA retired CASCADE;',
+                          'COMMIT'], queries)
+
+    def test_swap_shadow_refuses_materialized_views(self):
+        cur = RecordingCursor([[('songplays',)], [('daily', 'm', ' SELECT 1;')]])
+        with self.assertRaises(ValueError):
+            swap_shadow(cur, cur)
+        self.assertEqual('ROLLBACK', cur.queries[-1])
+        self.assertFalse(any('SET SCHEMA' in q for q in cur.queries))
+
+
+class PartitionTestCase(TestCase):
+    def test_table_queries(self):
+        queries = table_queries(['songplays'])
+        self.assertIn('PARTITION BY RANGE (start_time)', queries[0])
+        self.assertNotIn('PARTITION BY', queries[4])
+        self.assertIn('PARTITION BY RANGE (start_time)', table_queries(['time'])[4])
+        with self.assertRaises(ValueError):
+            table_queries(['users'])
+
+    def test_months(self):
+        self.assertEqual((datetime.date(2018, 12, 1), datetime.date(2019, 1, 1)),
+                         month_bounds(datetime.date(2018, 12, 15)))
+        self.assertEqual('songplays_2018_02', partition_name('songplays', datetime.date(2018, 2, 1)))
+
+    def test_create_partitions(self):
+        cur = RecordingCursor()
+        months = [datetime.date(2018, 11, 1), datetime.date(2018, 12, 1)]
+        created = create_partitions(cur, 'songplays', months)
+        self.assertEqual([('songplays_2018_11', months[0], months[1]),
+                          ('songplays_2018_12', months[1], datetime.date(2019, 1, 1))], created)
+        self.assertIn('songplays_2018_12 PARTITION OF songplays', cur.queries[1])
+        self.assertEqual((months[1], datetime.date(2019, 1, 1)), cur.args[1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+from unittest import TestCase, main
+from dimensions import DimensionCollector
+from etl import log_cols
+
+
+def log_row(user_id, first_name, level, ts, hour):
+    values = {'song': 'Song A', 'artist': 'Artist A', 'userId': user_id,
+              'firstName': first_name, 'lastName': 'L', 'gender': 'F',
+              'level': level, 'sessionId': '7', 'location': 'X', 'userAgent': 'Y',
+              'ts': ts, 'hour': hour, 'day': '1', 'week': '1', 'month': '1',
+              'year': '2018', 'weekday': 'True'}
+    return '\t'.join(values[k] for k in log_cols) + '\n'
+
+
+class NullCursor:
+    def __init__(self):
+        self.copied = {}
+        self.queries = []
+
+    def execute(self, query):
+        self.queries.append(query)
+
+    def copy_from(self, f, table, columns=None, null=''):
+        self.copied[table] = f.read()
+
+
+class DimensionCollectorTestCase(TestCase):
+    def setUp(self):
+        self.dimensions = DimensionCollector(log_cols.keys())
+
+    def test_lean_rows(self):
+        lean = self.dimensions.tap(log_row('1', 'Ann', 'free', '2018-01-01 10:00:00', '10'))
+        self.assertEqual(['song', 'artist', 'userId', 'level', 'sessionId',
+                          'location', 'userAgent', 'ts'], self.dimensions.lean_columns)
+        self.assertEqual('Song A\tArtist A\t1\tfree\t7\tX\tY\t2018-01-01 10:00:00\n', lean)
+        self.assertEqual('', self.dimensions.tap(''))
+
+    def test_rows_split_on_newline_only(self):
+        chunk = log_row('1', 'Ann\x0bMarie\u2028', 'free', '2018-01-01 10:00:00', '10')
+        lean = self.dimensions.tap(chunk.replace('Song A', 'Song\x1cA'))
+        self.assertEqual('Song\x1cA\tArtist A\t1\tfree\t7\tX\tY\t2018-01-01 10:00:00\n', lean)
+        self.assertEqual('1\tAnn\x0bMarie\u2028\tL\tF\tfree', self.dimensions.users['1'][1])
+
+    def test_distinct_times_and_latest_users(self):
+        self.dimensions.tap(log_row('1', 'Ann', 'paid', '2018-01-01 11:00:00', '11')
+                            + log_row('1', 'Ann', 'free', '2018-01-01 10:00:00', '10'))
+        self.dimensions.tap(log_row('2', 'Bob', 'free', '2018-01-01 10:00:00', '10')
+                            + log_row('1', 'Ann', 'free', '2018-01-01 09:00:00', '9'))
+        cur = NullCursor()
+        self.assertEqual(5, self.dimensions.copy(cur))
+        self.assertEqual(['2018-01-01 09:00:00\t9\t1\t1\t1\t2018\tTrue',
+                          '2018-01-01 10:00:00\t10\t1\t1\t1\t2018\tTrue',
+                          '2018-01-01 11:00:00\t11\t1\t1\t1\t2018\tTrue'],
+                         sorted(cur.copied['time_staging'].splitlines()))
+        self.assertEqual(['1\tAnn\tL\tF\tpaid', '2\tBob\tL\tF\tfree'],
+                         sorted(cur.copied['user_staging'].splitlines()))
+
+    def test_create_and_drop_tables(self):
+        cur = NullCursor()
+        self.dimensions.create_tables(cur)
+        self.dimensions.drop_tables(cur)
+        self.assertIn('CREATE UNLOGGED TABLE time_staging', cur.queries[0])
+        self.assertIn('CREATE UNLOGGED TABLE user_staging', cur.queries[1])
+        self.assertEqual('DROP TABLE IF EXISTS time_staging, user_staging;', cur.queries[2])
+
+
+if __name__ == '__main__':
+    main()
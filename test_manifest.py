@@ -0,0 +1,89 @@
+from unittest import TestCase, main
+import os
+import tempfile
+from types import SimpleNamespace
+from manifest import Manifest, file_hash
+
+
+class ManifestCursor:
+    """Returns the recorded manifest rows, and records the rows upserted."""
+    connection = SimpleNamespace(encoding='UTF8')
+
+    def __init__(self, recorded=()):
+        self.recorded = list(recorded)
+        self.queries = []
+        self.upserted = []
+
+    def execute(self, query, args=None):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return self.recorded
+
+    def mogrify(self, template, args):
+        self.upserted.append(tuple(args))
+        return b'()'
+
+
+class ManifestTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.manifest = Manifest()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def entry(self, path):
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime, file_hash(path))
+
+    def test_changed_files(self):
+        new = self.write('new.json', '{"a": 1}')
+        unchanged = self.write('unchanged.json', '{"b": 1}')
+        resized = self.write('resized.json', '{"c": 1}')
+        rewritten = self.write('rewritten.json', '{"d": 1}', mtime=2000)
+        touched = self.write('touched.json', '{"e": 1}', mtime=2000)
+        self.write('ignored.txt', 'x')
+        recorded = [self.entry(unchanged),
+                    (resized, 3, os.stat(resized).st_mtime, 'old'),
+                    # same size, older mtime, different contents
+                    (rewritten, os.path.getsize(rewritten), 1000, 'old'),
+                    # older mtime, same contents
+                    (touched, os.path.getsize(touched), 1000, file_hash(touched))]
+        cur = ManifestCursor(recorded)
+
+        changed = self.manifest.changed_files(cur, self.dir.name)
+
+        self.assertEqual([self.entry(new), self.entry(resized), self.entry(rewritten)],
+                         changed)
+        # only the touched file is recorded now, with its new mtime; the
+        # changed ones are recorded by etl.main once they are loaded
+        self.assertEqual([self.entry(touched)], cur.upserted)
+
+    def test_pack_rejected(self):
+        cur = ManifestCursor()
+        with self.assertRaises(ValueError):
+            self.manifest.changed_files(cur, os.path.join(self.dir.name, 'songs.pack'))
+        self.assertEqual([], cur.queries)
+
+    def test_record(self):
+        path = self.write('new.json', '{"a": 1}')
+        cur = ManifestCursor()
+        self.manifest.record(cur, [])
+        self.assertEqual([], cur.queries)
+        self.manifest.record(cur, [self.entry(path)])
+        self.assertEqual([self.entry(path)], cur.upserted)
+        self.assertEqual(1, len(cur.queries))
+        self.assertIn(b'file_manifest', cur.queries[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from unittest import TestCase, main
+import io
+import json
+import sql_queries
+from metrics import Metrics, query_name
+
+
+class MetricsTestCase(TestCase):
+    def test_stage_writes_json_line(self):
+        out = io.StringIO()
+        metrics = Metrics(out, run='test')
+        with metrics.stage('copy', table='t') as record:
+            record['rows'] = 3
+        line = json.loads(out.getvalue())
+        self.assertEqual(('copy', 't', 'test', 3), (line['stage'], line['table'], line['run'], line['rows']))
+        for key in ['wall_s', 'cpu_s', 'children_cpu_s', 'rss_mb', 'max_rss_mb']:
+            self.assertIn(key, line)
+        self.assertNotIn('peak_rss_mb', line)
+
+    def test_stage_records_error(self):
+        metrics = Metrics(io.StringIO(), trace_memory=True)
+        with self.assertRaises(ZeroDivisionError):
+            with metrics.stage('fail'):
+                1 / 0
+        self.assertIn('ZeroDivisionError', metrics.records[0]['error'])
+        self.assertIn('peak_traced_mb', metrics.records[0])
+        self.assertIn('peak_rss_mb', metrics.records[0])
+
+    def test_peaks_are_per_stage(self):
+        metrics = Metrics(io.StringIO(), trace_memory=True)
+        with metrics.stage('big'):
+            data = b'x' * (64 << 20)
+            del data
+        with metrics.stage('small'):
+            pass
+        big, small = metrics.records
+        self.assertGreaterEqual(big['peak_traced_mb'], 64)
+        self.assertLess(small['peak_traced_mb'], 1)
+
+    def test_query_name(self):
+        self.assertEqual('insert songplays', query_name(sql_queries.songplay_table_insert))
+        self.assertEqual('fk fk__songplays__time', query_name(sql_queries.set_fk1))
+        self.assertEqual('index idx_user_id', query_name(sql_queries.set_idx2))
+        self.assertEqual('delete user_daily_plays', query_name(sql_queries.user_daily_delete))
+        self.assertEqual('create touched_days', query_name(sql_queries.touched_days_create))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+from unittest import TestCase, main
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+from etl import transform_song, transform_log
+from generate_data import generate
+from pack import pack
+from sources import members, open_file, read_index, iter_records
+from staging import Stager, extract
+
+
+class PackTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        generate(self.root, n_songs=30, n_events=10, days=1)
+        self.songs = os.path.join(self.root, 'song_data')
+        self.pack_path = os.path.join(self.root, 'songs.pack')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_pack_matches_files(self):
+        self.assertEqual(30, pack(self.songs, self.pack_path))
+        packed = list(extract(self.pack_path))
+        self.assertEqual(30, len(packed))
+        for member in packed:
+            with open_file(member) as f, open(member.path) as g:
+                self.assertEqual(g.read().rstrip('\n'), f.read().rstrip('\n'))
+        from_pack = Stager(self.pack_path, 'song_staging', ['a'], transform_song)
+        from_dir = Stager(self.songs, 'song_staging', ['a'], transform_song)
+        expected = sorted(''.join(from_dir.transform()).splitlines())
+        self.assertEqual(expected, sorted(''.join(from_pack.transform(workers=2)).splitlines()))
+
+    def test_append(self):
+        pack(self.songs, self.pack_path)
+        self.assertEqual(0, pack(self.songs, self.pack_path))
+        new = os.path.join(self.songs, 'new.json')
+        with open(new, 'w') as f:
+            f.write('{"title": "new"}')
+        self.assertEqual(1, pack(self.songs, self.pack_path))
+        self.assertEqual(31, len(read_index(self.pack_path)))
+        last = list(members(self.pack_path))[-1]
+        self.assertEqual(new, last.path)
+        with open_file(last, 'rb') as f:
+            self.assertEqual(b'{"title": "new"}\n', f.read())
+
+
+class IterRecordsTestCase(TestCase):
+    def test_file_and_pack_member(self):
+        with tempfile.TemporaryDirectory() as root:
+            src = os.path.join(root, 'logs')
+            os.makedirs(src)
+            for name, text in [('a.json', '{"a": 1}\n\n{"a": 2}'), ('b.json', ''),
+                               ('c.json', '{"c": 3}\n')]:
+                with open(os.path.join(src, name), 'w') as f:
+                    f.write(text)
+            expected = [[b'{"a": 1}', b'{"a": 2}'], [], [b'{"c": 3}']]
+            self.assertEqual(expected, [list(iter_records(f)) for f in extract(src)])
+            pack_path = os.path.join(root, 'logs.pack')
+            pack(src, pack_path)
+            self.assertEqual(expected, [list(iter_records(m)) for m in extract(pack_path)])
+
+
+class CompressedTestCase(TestCase):
+    def test_compressed_logs(self):
+        with tempfile.TemporaryDirectory() as root:
+            generate(root, n_songs=10, n_events=300, days=3)
+            logs = os.path.join(root, 'log_data')
+            stager = Stager(logs, 'log_staging', ['a'], transform_log)
+            expected = ''.join(stager.transform())
+            openers = [('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)]
+            for path, (suffix, opener) in zip(extract(logs), openers):
+                with open(path, 'rb') as f, opener(path + suffix, 'wb') as g:
+                    g.write(f.read())
+                os.remove(path)
+            self.assertEqual(3, len([f for f in extract(logs) if not f.endswith('.json')]))
+            self.assertEqual(expected, ''.join(stager.transform()))
+            self.assertEqual(expected, ''.join(stager.transform(workers=2)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+from unittest import TestCase, main
+import datetime
+import struct
+from decimal import Decimal
+from pgcopy import encode_decimal, encode_timestamp, encode_row, get_encoders
+from pgcopy import RowEncoder, HEADER
+
+
+def numeric(ndigits, weight, sign, dscale, *digits):
+    return (struct.pack('!ihhHh', 8 + 2 * ndigits, ndigits, weight, sign, dscale)
+            + struct.pack('!%dH' % ndigits, *digits))
+
+
+def rows(filepath):
+    yield ('a', 1, None)
+
+
+class EncodeTestCase(TestCase):
+    def test_decimal(self):
+        cases = [(Decimal('1234.5678'), numeric(2, 0, 0, 4, 1234, 5678)),
+                 (Decimal('0.001'), numeric(1, -1, 0, 3, 10)),
+                 (-12345, numeric(2, 1, 0x4000, 0, 1, 2345)),
+                 (Decimal('0'), numeric(0, 0, 0, 0)),
+                 (-93.01, numeric(2, 0, 0x4000, 2, 93, 100))]
+        for value, expected in cases:
+            self.assertEqual(expected, encode_decimal(value), value)
+
+    def test_timestamp(self):
+        ts = datetime.datetime(2000, 1, 2, 0, 0, 1)
+        expected = struct.pack('!iq', 8, 86401 * 1000000)
+        self.assertEqual(expected, encode_timestamp(ts))
+
+    def test_row(self):
+        row_encoders = get_encoders(['TEXT', 'INT', 'BOOLEAN'])
+        expected = (b'\x00\x03' + b'\x00\x00\x00\x02hi' + b'\x00\x00\x00\x04\x00\x00\x00\x07'
+                    + b'\xff\xff\xff\xff')
+        self.assertEqual(expected, encode_row(('hi', 7, None), row_encoders))
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            get_encoders(['JSONB'])
+
+    def test_header(self):
+        self.assertEqual(19, len(HEADER))
+
+    def test_row_encoder(self):
+        encoder = RowEncoder(rows, ['TEXT', 'INTEGER', 'DECIMAL'])
+        self.assertEqual(1, len(list(encoder('unused'))))
+
+
+if __name__ == '__main__':
+    main()
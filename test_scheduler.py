@@ -0,0 +1,130 @@
+from unittest import TestCase, main
+import datetime
+import threading
+import sql_queries
+from scheduler import Task, check_tasks, run_tasks, index_names, post_load_tasks
+from scheduler import insert_tasks, critical_path, run_in_transaction, partition_insert
+
+
+class SchedulerTestCase(TestCase):
+    def test_dependencies_run_first(self):
+        tasks = [Task('c', None, ['a', 'b']), Task('a', None), Task('b', None, ['a'])]
+        order = []
+        timings = run_tasks(tasks, lambda t: order.append(t.name), 2)
+        self.assertEqual(['a', 'b', 'c'], order)
+        self.assertLessEqual(timings['b'][1], timings['c'][0])
+
+    def test_independent_tasks_overlap(self):
+        barrier = threading.Barrier(2, timeout=5)
+        tasks = [Task('a', None), Task('b', None)]
+        run_tasks(tasks, lambda t: barrier.wait(), 2)
+
+    def test_failure_stops_dependents(self):
+        def execute(task):
+            if task.name == 'a':
+                raise RuntimeError('failed')
+            ran.append(task.name)
+        ran = []
+        with self.assertRaises(RuntimeError):
+            run_tasks([Task('a', None), Task('b', None, ['a'])], execute, 2)
+        self.assertEqual([], ran)
+
+    def test_check_tasks(self):
+        with self.assertRaises(ValueError):
+            check_tasks([Task('a', None, ['b']), Task('b', None, ['a'])])
+        with self.assertRaises(ValueError):
+            check_tasks([Task('a', None, ['x'])])
+        with self.assertRaises(ValueError):
+            check_tasks([Task('a', None), Task('a', None)])
+
+    def test_index_name_collision(self):
+        queries = ["CREATE INDEX IF NOT EXISTS idx_artist_id ON songplays (artist_id);",
+                   "CREATE INDEX IF NOT EXISTS idx_artist_id ON songs (artist_id);"]
+        with self.assertRaises(ValueError):
+            index_names(queries)
+
+    def test_post_load_tasks(self):
+        tasks = post_load_tasks(sql_queries.fk_queries, sql_queries.idx_queries)
+        check_tasks(tasks)
+        adds = [t for t in tasks if t.name.startswith('add ')]
+        self.assertEqual(len(sql_queries.fk_queries), len(adds))
+        self.assertTrue(all(t.query.endswith('NOT VALID;') for t in adds))
+        validates = [t for t in tasks if t.name.startswith('validate ')]
+        self.assertEqual(len(adds), len(validates))
+        self.assertEqual(len(sql_queries.idx_queries) + 2 * len(adds), len(tasks))
+
+    def test_insert_tasks(self):
+        tasks = insert_tasks(sql_queries.insert_queries)
+        by_name = {t.name: t for t in tasks}
+        self.assertEqual(4, len(by_name['insert songplays'].deps))
+        self.assertEqual(4, sum(1 for t in tasks if not t.deps))
+
+    def test_post_load_tasks_partitioned(self):
+        partitions = {'songplays': ['songplays_2018_10', 'songplays_2018_11']}
+        tasks = post_load_tasks(sql_queries.fk_queries, sql_queries.idx_queries, partitions)
+        check_tasks(tasks)
+        by_name = {t.name: t for t in tasks}
+        self.assertFalse(by_name['add fk__songplays__time'].query.endswith('NOT VALID;'))
+        self.assertNotIn('validate fk__songplays__time', by_name)
+        self.assertIn('validate fk__songs__artists', by_name)
+        self.assertEqual('CREATE INDEX IF NOT EXISTS idx_user_id ON ONLY songplays (user_id);',
+                         by_name['index idx_user_id'].query)
+        self.assertEqual('CREATE INDEX IF NOT EXISTS songplays_2018_11_idx_user_id '
+                         'ON songplays_2018_11 (user_id);',
+                         by_name['index songplays_2018_11_idx_user_id'].query)
+        self.assertEqual(('index idx_user_id', 'index songplays_2018_11_idx_user_id'),
+                         by_name['attach songplays_2018_11_idx_user_id'].deps)
+        self.assertEqual('CREATE INDEX IF NOT EXISTS idx_songs_artist_id ON songs (artist_id);',
+                         by_name['index idx_songs_artist_id'].query)
+
+    def test_insert_tasks_partitioned(self):
+        months = [datetime.date(2018, 10, 1), datetime.date(2018, 11, 1), datetime.date(2018, 12, 1)]
+        partitions = [('songplays_2018_10', months[0], months[1]),
+                      ('songplays_2018_11', months[1], months[2])]
+        tasks = insert_tasks(sql_queries.insert_queries, partitions)
+        by_name = {t.name: t for t in tasks}
+        self.assertNotIn('insert songplays', by_name)
+        self.assertEqual(4, len(by_name['insert songplays_2018_11'].deps))
+        query = by_name['insert songplays_2018_11'].query
+        self.assertTrue(query.startswith('INSERT INTO songplays_2018_11 (start_time, user_id,'))
+        self.assertIn("WHERE r.start_time >= '2018-11-01' AND r.start_time < '2018-12-01'", query)
+
+    def test_partition_insert_keeps_select(self):
+        query = partition_insert(sql_queries.songplay_table_upsert, 'songplays_2018_11',
+                                 datetime.date(2018, 11, 1), datetime.date(2018, 12, 1))
+        self.assertIn('WHERE NOT EXISTS (', query)
+        self.assertEqual(1, query.count('ON CONFLICT DO NOTHING'))
+
+    def test_critical_path(self):
+        tasks = [Task('a', None), Task('b', None), Task('c', None, ['a', 'b'])]
+        timings = {'a': (0, 1), 'b': (0, 3), 'c': (3, 4)}
+        self.assertEqual(['b', 'c'], critical_path(tasks, timings))
+
+    def test_run_in_transaction_commits_once(self):
+        class Conn:
+            def cursor(self):
+                return Cursor()
+            def commit(self):
+                commits.append(self)
+            def rollback(self):
+                pass
+            def close(self):
+                pass
+        class Cursor:
+            rowcount = 1
+            def __enter__(self):
+                return self
+            def __exit__(self, *args):
+                pass
+            def execute(self, query):
+                executed.append(query)
+        commits, executed = [], []
+        tasks = insert_tasks(sql_queries.insert_queries)
+        run_in_transaction(tasks, Conn)
+        self.assertEqual(5, len(executed))
+        self.assertEqual(sql_queries.songplay_table_insert, executed[-1])
+        self.assertEqual(4, len(commits))
+
+
+if __name__ == '__main__':
+    main()
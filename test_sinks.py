@@ -0,0 +1,28 @@
+from unittest import TestCase, main
+import io
+import tempfile
+from sinks import NullSink, FileSink, replay
+from string_iterator import StringIteratorIO
+
+
+class SinkTestCase(TestCase):
+    def test_null_sink_counts(self):
+        sink = NullSink(size=4)
+        sink.copy_from(StringIteratorIO(iter(['a\tb\n', 'c\td\n'])), 'test')
+        self.assertEqual((2, 8), (sink.rows, sink.bytes))
+
+    def test_file_sink_replay(self):
+        with tempfile.TemporaryDirectory() as d:
+            sink = FileSink(d)
+            sink.copy_from(io.StringIO('a\t\n'), 'test', null='', columns=('x', 'y'))
+            sink.copy_expert('COPY test (x) FROM STDIN WITH (FORMAT binary);',
+                             io.BytesIO(b'\x00\x01'))
+            self.assertEqual(2, len(sink.paths))
+            target = NullSink()
+            for path in sink.paths:
+                replay(target, path)
+            self.assertEqual((1, 5), (target.rows, target.bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+from unittest import TestCase, main
+import pickle
+from song_index import SongIndex
+from etl import song_cols
+
+
+def song_row(artist_id, artist_name, song_id, title):
+    values = {'artist_id': artist_id, 'artist_name': artist_name, 'song_id': song_id,
+              'title': title}
+    return '\t'.join(values.get(k, '') for k in song_cols) + '\n'
+
+
+class SongIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = SongIndex(song_cols.keys())
+        chunk = (song_row('AR1', 'Artist A', 'SO1', 'Song A')
+                 + song_row('AR2', 'Artist B', 'SO2', 'Song B')
+                 + song_row('AR3', 'Artist B', 'SO3', 'Song B'))
+        self.assertEqual(chunk, self.index.tap(chunk))
+
+    def test_lookup(self):
+        self.assertEqual(2, len(self.index))
+        self.assertEqual(('SO1', 'AR1'), self.index.get('Song A', 'Artist A'))
+        self.assertEqual(('SO2', 'AR2'), self.index.get('Song B', 'Artist B'))
+        self.assertIsNone(self.index.get('Song A', 'Artist B'))
+
+    def test_title_with_line_separator(self):
+        self.index.tap(song_row('AR4', 'Artist C', 'SO4', 'Song\u2028C\x0c'))
+        self.assertEqual(('SO4', 'AR4'), self.index.get('Song\u2028C\x0c', 'Artist C'))
+
+    def test_pickle(self):
+        index = pickle.loads(pickle.dumps(self.index))
+        self.assertEqual(('SO1', 'AR1'), index.get('Song A', 'Artist A'))
+
+    def test_memory_footprint(self):
+        self.assertGreater(self.index.memory_footprint(), 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+from unittest import TestCase, main
+import os
+import tempfile
+import pgcopy
+import sql_queries
+from staging import Stager, parallel_transform, discover, shard, FileInfo, Pipeline, extract
+
+
+def upper(filepath):
+    with open(filepath) as f:
+        return f.read().upper()
+
+
+def upper_rows(filepath):
+    with open(filepath) as f:
+        for line in f:
+            yield line.upper()
+
+
+def upper_tuples(filepath):
+    with open(filepath) as f:
+        for line in f:
+            yield (line.strip().upper(),)
+
+
+class FakeCursor:
+    """Stands in for a psycopg2 cursor, recording what COPY would receive."""
+    def __init__(self):
+        self.copied = ''
+        self.queries = []
+
+    def execute(self, query):
+        self.queries.append(query)
+
+    def copy_from(self, f, table, columns=None, null=''):
+        while (chunk := f.read(8192)):
+            self.copied += chunk
+
+    def copy_expert(self, query, f):
+        self.query = query
+        self.copied = f.read()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cur = FakeCursor()
+        self.committed = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StagerTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        for i in range(20):
+            with open(os.path.join(self.dir.name, '%02d.json' % i), 'w') as f:
+                f.write('row%d\n' % i)
+        self.stager = Stager(self.dir.name, 'test_staging', ['a'], upper)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def expected(self):
+        return ''.join(self.stager.transform())
+
+    def test_parallel_transform_keeps_order(self):
+        # not files, so they can't be sized
+        files = [str(i) for i in range(10)]
+        result = list(parallel_transform(str.upper, files, 2, chunksize=3, chunk_bytes=None))
+        self.assertEqual(['012', '345', '678', '9'], result)
+
+    def test_parallel_transform_chunk_bytes(self):
+        files = sorted(os.path.join(self.dir.name, f) for f in os.listdir(self.dir.name))
+        # files of 5 bytes (00-09), then of 6 bytes (10-19)
+        result = list(parallel_transform(upper, files, 2, chunk_bytes=12))
+        self.assertEqual(10, len(result))
+        self.assertEqual('ROW0\nROW1\n', result[0])
+        self.assertEqual(self.expected(), ''.join(result))
+        # files larger than chunk_bytes are sent one at a time
+        self.assertEqual(20, len(list(parallel_transform(upper, files, 2, chunk_bytes=1))))
+
+    def test_copy_with_workers(self):
+        cur = FakeCursor()
+        self.stager.copy(cur, workers=2, chunksize=3)
+        self.assertEqual(self.expected(), cur.copied)
+
+    def test_copy_no_stream(self):
+        cur = FakeCursor()
+        self.stager.copy(cur, stream=False, workers=2)
+        self.assertEqual(self.expected(), cur.copied)
+
+    def test_copy_row_generator(self):
+        expected = self.expected()
+        for workers in [None, 2]:
+            cur = FakeCursor()
+            self.stager.transformer = upper_rows
+            self.stager.copy(cur, workers=workers)
+            self.assertEqual(expected, cur.copied)
+
+    def test_copy_sharded(self):
+        conns = []
+        def connect():
+            conns.append(FakeConnection())
+            return conns[-1]
+        self.stager.copy_sharded(connect, 3)
+        self.assertEqual(3, len(conns))
+        self.assertTrue(all(c.committed for c in conns))
+        copied = ''.join(c.cur.copied for c in conns)
+        self.assertEqual(sorted(self.expected().splitlines()), sorted(copied.splitlines()))
+
+    def test_copy_binary(self):
+        self.stager.row_transformer = upper_tuples
+        for workers in [None, 2]:
+            cur = FakeCursor()
+            self.stager.copy(cur, workers=workers, binary=True)
+            self.assertIn('FORMAT binary', cur.query)
+            self.assertTrue(cur.copied.startswith(pgcopy.HEADER))
+            self.assertTrue(cur.copied.endswith(pgcopy.TRAILER))
+            self.assertIn(b'\x00\x01\x00\x00\x00\x05ROW19', cur.copied)
+
+    def test_copy_pipelined(self):
+        for workers in [None, 2]:
+            cur = FakeCursor()
+            self.stager.copy(cur, workers=workers, pipeline_depth=2)
+            self.assertEqual(self.expected(), cur.copied)
+            self.assertIn('get_wait_s', self.stager.pipeline_stats)
+
+
+class ProgressConnection:
+    """
+    Stands in for a psycopg2 connection for Stager.copy_checkpointed:
+    the copied data and the progress rows are kept when committed.
+    """
+    def __init__(self, fail_after=None):
+        self.copied = ''
+        self.progress = {}
+        self.copies = 0
+        self.fail_after = fail_after  # number of copies before failing
+        self.files = {}
+        self.rollback()
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def execute(self, query, args=()):
+        if query == sql_queries.progress_select:
+            row = self._progress.get(args[0])
+            self._row = row and (row[0], row[1], row[2])
+        elif query == sql_queries.progress_upsert:
+            table, last_file, files, nbytes = args
+            _, old_files, old_bytes = self._progress.get(table, (None, 0, 0))
+            self._progress[table] = (last_file, old_files + files, old_bytes + nbytes)
+        elif query == sql_queries.progress_files_select:
+            self._rows = [(key,) for key in self._files.get(args[0], ())]
+        elif query == sql_queries.progress_files_insert:
+            table, keys = args
+            self._files[table] = self._files.get(table, set()) | set(keys)
+        elif query == sql_queries.progress_delete:
+            self._progress.pop(args[0], None)
+            self._files.pop(args[1], None)
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return self._rows
+
+    def copy_from(self, f, table, columns=None, null=''):
+        if self.copies == self.fail_after:
+            raise IOError('connection lost')
+        self.copies += 1
+        self._copied += f.read()
+
+    def commit(self):
+        self.copied = self._copied
+        self.progress = dict(self._progress)
+        self.files = dict(self._files)
+
+    def rollback(self):
+        self._copied = self.copied
+        self._progress = dict(self.progress)
+        self._files = dict(self.files)
+
+
+class CheckpointTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        for i in range(10):
+            with open(os.path.join(self.dir.name, '%02d.json' % i), 'w') as f:
+                f.write('row%d\n' % i)
+        self.stager = Stager(self.dir.name, 'test_staging', ['a'], upper)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_batches(self):
+        conn = ProgressConnection()
+        self.assertEqual(50, self.stager.copy_checkpointed(conn, batch_files=3))
+        self.assertEqual(4, conn.copies)
+        self.assertEqual(''.join(self.stager.transform()), conn.copied)
+        last_file, files, nbytes = conn.progress['test_staging']
+        self.assertTrue(last_file.endswith('09.json'))
+        self.assertEqual((10, 50), (files, nbytes))
+
+    def test_progress_counts_input_bytes(self):
+        with open(os.path.join(self.dir.name, '10.json'), 'w', encoding='utf-8') as f:
+            f.write('caf\u00e9\n')
+        conn = ProgressConnection()
+        # 5 characters of the new file, 6 bytes
+        self.assertEqual(55, self.stager.copy_checkpointed(conn, batch_files=3))
+        self.assertEqual((11, 56), conn.progress['test_staging'][1:])
+
+    def test_batch_bytes(self):
+        conn = ProgressConnection()
+        self.stager.copy_checkpointed(conn, batch_bytes=10)
+        self.assertEqual(5, conn.copies)
+
+    def test_resume(self):
+        conn = ProgressConnection(fail_after=2)
+        with self.assertRaises(IOError):
+            self.stager.copy_checkpointed(conn, batch_files=3)
+        conn.rollback()
+        self.assertEqual('ROW0\nROW1\nROW2\nROW3\nROW4\nROW5\n', conn.copied)
+        self.assertEqual(6, conn.progress['test_staging'][1])
+
+        conn.fail_after = None
+        self.assertEqual(20, self.stager.copy_checkpointed(conn, batch_files=3))
+        self.assertEqual(''.join(self.stager.transform()), conn.copied)
+        self.assertEqual(10, conn.progress['test_staging'][1])
+
+        self.stager.clear_progress(conn)
+        conn.commit()
+        self.assertEqual({}, conn.progress)
+
+    def test_create_logged_table(self):
+        cur = FakeCursor()
+        self.stager.create_table(cur, if_not_exists=True, logged=True)
+        self.stager.create_table(cur)
+        self.assertEqual(['CREATE TABLE IF NOT EXISTS test_staging (id SERIAL, a TEXT);',
+                          'CREATE UNLOGGED TABLE test_staging (id SERIAL, a TEXT);'],
+                         cur.queries)
+
+    def test_resume_copies_new_files_sorting_earlier(self):
+        conn = ProgressConnection(fail_after=1)
+        with self.assertRaises(IOError):
+            self.stager.copy_checkpointed(conn, batch_files=5)
+        conn.rollback()
+        # added after the failure, before and after the last copied file
+        for name in ['00a.json', '07a.json']:
+            with open(os.path.join(self.dir.name, name), 'w') as f:
+                f.write(name[:3] + '\n')
+        conn.fail_after = None
+        self.stager.copy_checkpointed(conn, batch_files=5)
+        self.assertEqual(sorted(''.join(self.stager.transform()).splitlines()),
+                         sorted(conn.copied.splitlines()))
+        self.assertEqual(12, conn.progress['test_staging'][1])
+
+    def test_resume_missing_file(self):
+        conn = ProgressConnection()
+        self.stager.copy_checkpointed(conn, batch_files=3)
+        os.remove(os.path.join(self.dir.name, '09.json'))
+        with self.assertRaises(ValueError):
+            self.stager.copy_checkpointed(conn)
+
+
+class PipelineTestCase(TestCase):
+    def test_items_in_order(self):
+        pipeline = Pipeline(iter(range(100)), depth=3)
+        self.assertEqual(list(range(100)), list(pipeline))
+        stats = pipeline.stats()
+        self.assertEqual(100, stats['items'])
+        self.assertLessEqual(stats['mean_occupancy'], 3)
+
+    def test_producer_error(self):
+        def gen():
+            yield 1
+            raise KeyError('x')
+        with self.assertRaises(KeyError):
+            list(Pipeline(gen()))
+
+    def test_consumer_stops_early(self):
+        produced = []
+        def gen():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        pipeline = Pipeline(gen(), depth=2)
+        for item in pipeline:
+            break
+        pipeline.close()
+        self.assertLess(len(produced), 10)
+
+
+class DiscoverTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        os.makedirs(os.path.join(self.root, 'a', 'b'))
+        for name, size in [('x.json', 3), ('a/y.json', 5), ('a/b/z.json', 1), ('a/skip.txt', 2)]:
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('.' * size)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_discover(self):
+        files = discover(self.root)
+        self.assertEqual([os.path.join(self.root, p) for p in ['a/b/z.json', 'a/y.json', 'x.json']],
+                         [f.path for f in files])
+        self.assertEqual([1, 5, 3], [f.size for f in files])
+
+    def test_symlink_loop(self):
+        os.symlink(self.root, os.path.join(self.root, 'a', 'loop'))
+        self.assertEqual(3, len(discover(self.root)))
+
+    def test_cache(self):
+        cache_path = os.path.join(self.root, 'listing.cache')
+        self.assertEqual(discover(self.root), discover(self.root, cache_path=cache_path))
+        with open(os.path.join(self.root, 'a', 'b', 'w.json'), 'w') as f:
+            f.write('new')
+        self.assertEqual(discover(self.root), discover(self.root, cache_path=cache_path))
+        self.assertEqual(4, len(discover(self.root, cache_path=cache_path)))
+
+    def test_extract_uses_cache(self):
+        cache_path = os.path.join(self.root, 'listing.cache')
+        self.assertEqual(discover(self.root), list(extract(self.root, cache_path, info=True)))
+        self.assertTrue(os.path.exists(cache_path))
+        self.assertEqual([f.path for f in discover(self.root)], list(extract(self.root, cache_path)))
+
+    def test_shard_uses_discovered_sizes(self):
+        # the files don't exist: their sizes must come from the FileInfo tuples
+        files = [FileInfo('missing{}.json'.format(i), size, 0) for i, size in enumerate([3, 2, 1])]
+        self.assertEqual([[files[0]], [files[1], files[2]]], shard(files, 2))
+
+    def test_shard_balances_sizes(self):
+        files = [FileInfo(str(i), size, 0) for i, size in enumerate([10, 1, 1, 1, 1, 6, 4])]
+        shards = shard(files, 2)
+        self.assertEqual([12, 12], sorted(sum(f.size for f in s) for s in shards))
+        self.assertEqual(sorted(files), sorted(f for s in shards for f in s))
+        for s in shards:
+            self.assertEqual(sorted(s, key=files.index), s)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from unittest import TestCase, main
-from string_iterator import StringIteratorIO
+from string_iterator import StringIteratorIO, BytesIteratorIO
 
 
 class StringIteratorTestCase(TestCase):
@@ -17,6 +17,48 @@ class StringIteratorTestCase(TestCase):
         expected = '0123'
         self.assertEqual(expected, result)
 
+    def test_read_across_chunks(self):
+        gen = iter(['ab', '', 'cde', 'f'])
+        with StringIteratorIO(gen) as g:
+            result = [g.read(3), g.read(1), g.read(5), g.read(1)]
+        expected = ['abc', 'd', 'ef', '']
+        self.assertEqual(expected, result)
+
+    def test_many_small_chunks(self):
+        gen = ('x' for _ in range(100000))
+        with StringIteratorIO(gen) as g:
+            result = g.read(50000)
+        self.assertEqual(50000, len(result))
+
+    def test_readline(self):
+        gen = iter(['a\tb\nc', 'd\n', 'ef'])
+        with StringIteratorIO(gen) as g:
+            result = [g.readline(), g.readline(1), g.readline(), g.readline(), g.readline()]
+        expected = ['a\tb\n', 'c', 'd\n', 'ef', '']
+        self.assertEqual(expected, result)
+
+    def test_iterate_lines(self):
+        gen = iter(['1\n2', '\n3\n'])
+        with StringIteratorIO(gen) as g:
+            result = list(g)
+        self.assertEqual(['1\n', '2\n', '3\n'], result)
+
+
+class BytesIteratorTestCase(TestCase):
+    def test_readinto(self):
+        gen = iter([b'abc', 'de', b'f'])
+        buf = bytearray(4)
+        with BytesIteratorIO(gen) as g:
+            result = [g.readinto(buf), bytes(buf), g.read()]
+        expected = [4, b'abcd', b'ef']
+        self.assertEqual(expected, result)
+
+    def test_readline(self):
+        gen = iter([b'a\nb', b'c\n'])
+        with BytesIteratorIO(gen) as g:
+            result = [g.readline(), g.readline(), g.readline()]
+        self.assertEqual([b'a\n', b'bc\n', b''], result)
+
 
 if __name__ == '__main__':
     main()
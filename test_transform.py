@@ -0,0 +1,124 @@
+from unittest import TestCase, main
+import datetime
+import json
+import numpy as np
+import os
+import tempfile
+from etl import transform_log, log_rows, time_columns, time_text
+from etl import transform_log_batch, local_seconds
+from etl import transform_song, song_rows, song_cols
+from song_index import SongIndex
+from generate_data import generate
+from staging import extract
+
+
+events = [
+    {'song': 'Song A', 'artist': 'Artist A', 'userId': '39', 'firstName': 'Walter',
+     'lastName': 'Frye', 'gender': 'M', 'level': 'free', 'sessionId': 38,
+     'location': 'San Francisco', 'userAgent': '"Mozilla/5.0"', 'page': 'NextSong',
+     'ts': 1541105830796},
+    {'song': None, 'artist': None, 'userId': '39', 'firstName': 'Walter',
+     'lastName': 'Frye', 'gender': 'M', 'level': 'free', 'sessionId': 38,
+     'location': 'San Francisco', 'userAgent': '"Mozilla/5.0"', 'page': 'Home',
+     'ts': 1541105830796},
+    {'song': 'Song B', 'artist': 'Artist B', 'userId': '', 'firstName': None,
+     'lastName': None, 'gender': None, 'level': 'free', 'sessionId': 52,
+     'location': None, 'userAgent': None, 'page': 'NextSong',
+     'ts': 1541106106796},
+    {'song': 'Song C', 'artist': 'Artist C', 'userId': '8', 'firstName': 'Kaylee',
+     'lastName': 'Summers', 'gender': 'F', 'level': 'paid', 'sessionId': 139,
+     'location': None, 'userAgent': '"Mozilla/5.0"', 'page': 'NextSong',
+     'ts': 1541106496796},
+]
+
+
+class TransformLogTestCase(TestCase):
+    def setUp(self):
+        fd, self.filepath = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def test_transform_log(self):
+        rows = list(transform_log(self.filepath))
+        self.assertEqual(2, len(rows))
+        fields = rows[0].rstrip('\n').split('\t')
+        self.assertEqual(17, len(fields))
+        self.assertEqual(['Song A', 'Artist A', '39'], fields[:3])
+        self.assertEqual('Mozilla/5.0', fields[9])
+        self.assertEqual('', rows[1].split('\t')[8])  # null location
+
+    def test_log_rows(self):
+        rows = list(log_rows(self.filepath))
+        self.assertEqual(2, len(rows))
+        self.assertEqual(8, rows[1][2])
+        self.assertIsNone(rows[1][8])
+
+    def test_resolved(self):
+        index = SongIndex(song_cols.keys())
+        index.add('Song A', 'Artist A', 'SOA', 'ARA')
+        rows = list(transform_log(self.filepath, index))
+        self.assertEqual(['SOA', 'ARA'], rows[0].rstrip('\n').split('\t')[-2:])
+        self.assertEqual(['', ''], rows[1].rstrip('\n').split('\t')[-2:])
+        rows = list(log_rows(self.filepath, index))
+        self.assertEqual(('SOA', 'ARA'), rows[0][-2:])
+        self.assertEqual((None, None), rows[1][-2:])
+
+    def test_transform_log_batch(self):
+        expected = ''.join(transform_log(self.filepath))
+        self.assertEqual([expected], list(transform_log_batch(self.filepath)))
+        self.assertEqual(expected, ''.join(transform_log_batch(self.filepath, batch_size=1)))
+        index = SongIndex(song_cols.keys())
+        index.add('Song A', 'Artist A', 'SOA', 'ARA')
+        self.assertEqual(''.join(transform_log(self.filepath, index)),
+                         ''.join(transform_log_batch(self.filepath, index)))
+
+    def test_local_seconds(self):
+        t = 1541105831
+        local = datetime.datetime.fromtimestamp(t).replace(tzinfo=datetime.timezone.utc)
+        self.assertEqual([local.timestamp()], list(local_seconds(np.array([t]))))
+
+    def test_time_text(self):
+        t = 1541105831
+        x = datetime.datetime.fromtimestamp(t)
+        expected = '\t'.join([x.strftime("%Y-%m-%d %H:%M:%S"), str(x.hour),
+                              str(x.day), str(x.isocalendar()[1]), str(x.month),
+                              str(x.year), str(x.weekday() not in [5, 6])])
+        self.assertEqual(expected, time_text(t))
+        hits = time_columns.cache_info().hits
+        time_columns(t)
+        self.assertEqual(hits + 1, time_columns.cache_info().hits)
+
+
+class GeneratedDataTestCase(TestCase):
+    def test_transformers_accept_generated_data(self):
+        with tempfile.TemporaryDirectory() as root:
+            generate(root, n_songs=20, n_events=200, days=2, seed=1)
+            songs = list(extract(os.path.join(root, 'song_data')))
+            logs = list(extract(os.path.join(root, 'log_data')))
+            self.assertEqual(20, len(songs))
+            self.assertEqual(2, len(logs))
+            for f in songs:
+                self.assertEqual(9, len(transform_song(f).split('\t')))
+                self.assertEqual(1, len(list(song_rows(f))))
+            rows = [row for f in logs for row in transform_log(f)]
+            self.assertTrue(0 < len(rows) < 200)
+            self.assertEqual(len(rows), sum(len(list(log_rows(f))) for f in logs))
+            self.assertEqual(''.join(rows),
+                             ''.join(text for f in logs for text in transform_log_batch(f)))
+
+    def test_ts_in_utc_days(self):
+        with tempfile.TemporaryDirectory() as root:
+            generate(root, n_songs=5, n_events=50, days=2, seed=1)
+            first = os.path.join(root, 'log_data', '2018', '11', '2018-11-01-events.json')
+            with open(first) as f:
+                ts = [json.loads(line)['ts'] for line in f]
+        day = datetime.datetime(2018, 11, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000
+        self.assertTrue(all(day <= t < day + 86400000 for t in ts))
+
+
+if __name__ == '__main__':
+    main()